@@ -107,6 +107,36 @@ TIME_ZONE = 'Europe/Moscow'
 USE_I18N = True
 USE_TZ = True
 
+# ========== КЕШ ==========
+# По умолчанию - локальная память процесса. Для нескольких процессов
+# укажите общий бэкенд (например, django.core.cache.backends.redis.RedisCache)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sportshop',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Кеш товаров (см. sportshop/product_cache.py)
+PRODUCT_CACHE_ALIAS = 'default'
+PRODUCT_CACHE_TIMEOUT = 300  # секунд
+
+# ========== РЕЗЕРВЫ ТОВАРОВ ==========
+# Срок резерва товаров в корзине и при оформлении (см. sportshop/reservations.py).
+# Просроченные резервы освобождает команда release_expired_reservations
+STOCK_RESERVATION_TTL = 15 * 60  # секунд
+
+# ========== ПОЧТА И ФОНОВЫЕ ЗАДАНИЯ ==========
+# Письма отправляются фоновыми заданиями (sportshop/jobs.py, команда
+# run_workers). Для разработки письма выводятся в консоль обработчика
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'SportShop <noreply@sportshop.local>'
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 30  # секунд, удваивается с каждой попыткой
+
 # ========== ДРУГИЕ НАСТРОЙКИ ==========
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 INTERNAL_IPS = ['127.0.0.1']
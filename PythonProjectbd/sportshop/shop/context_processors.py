@@ -1,14 +1,42 @@
 # shop/context_processors.py
+from django.conf import settings
+from django.core.cache import cache
+
 from .models import Category, CartItem
 
 
-def cart_context(request):
-    """Добавляет количество товаров в корзине в контекст"""
-    cart_count = 0
-    if request.user.is_authenticated:
+# Список категорий меняется редко: кешируется на время SHOP_CATEGORIES_TIMEOUT
+SHOP_CATEGORIES_TIMEOUT = getattr(settings, 'SHOP_CATEGORIES_TIMEOUT', 300)
+CART_COUNT_SESSION_KEY = 'shop_cart_count'
+
+
+def get_cart_count(request):
+    """Количество позиций в корзине (хранится в сессии до изменения корзины)"""
+    if not request.user.is_authenticated:
+        return 0
+    cart_count = request.session.get(CART_COUNT_SESSION_KEY)
+    if cart_count is None:
         cart_count = CartItem.objects.filter(user=request.user).count()
+        request.session[CART_COUNT_SESSION_KEY] = cart_count
+    return cart_count
+
 
+def reset_cart_count(request):
+    """Сбросить счетчик после изменения корзины"""
+    request.session.pop(CART_COUNT_SESSION_KEY, None)
+
+
+def get_categories():
+    categories = cache.get('shop:categories')
+    if categories is None:
+        categories = list(Category.objects.all())
+        cache.set('shop:categories', categories, SHOP_CATEGORIES_TIMEOUT)
+    return categories
+
+
+def cart_context(request):
+    """Добавляет количество товаров в корзине в контекст"""
     return {
-        'cart_count': cart_count,
-        'categories': Category.objects.all(),
-    }
\ No newline at end of file
+        'cart_count': get_cart_count(request),
+        'categories': get_categories(),
+    }
@@ -3,6 +3,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
 
+from sportshop.order_numbers import HiLoSequence, format_order_number
+
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -139,6 +141,18 @@ class Product(models.Model):
         return self.old_price and self.old_price > self.price
 
 
+class OrderNumberBlock(models.Model):
+    # id блока - старшая часть номера заказа (см. sportshop/order_numbers.py)
+    allocated_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата выделения')
+
+    class Meta:
+        verbose_name = 'Блок номеров заказов'
+        verbose_name_plural = 'Блоки номеров заказов'
+
+
+_order_numbers = HiLoSequence(OrderNumberBlock)
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('Новый', 'Новый'),
@@ -172,12 +186,11 @@ class Order(models.Model):
         return f'Заказ {self.order_number}'
 
     def generate_order_number(self):
-        from datetime import datetime
-        return f'ORD-{datetime.now().strftime("%Y%m%d")}-{self.id:06d}'
+        # Номер известен до вставки: одна запись вместо INSERT + UPDATE
+        return format_order_number(_order_numbers.next_value())
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            super().save(*args, **kwargs)
             self.order_number = self.generate_order_number()
         super().save(*args, **kwargs)
 
@@ -3,7 +3,8 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import login, logout, authenticate
 from django.contrib import messages
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, F, Case, When
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from decimal import Decimal
@@ -12,6 +13,7 @@ import json
 from .models import *
 from .forms import *
 from .decorators import *
+from .context_processors import get_cart_count, reset_cart_count
 
 
 def index(request):
@@ -112,10 +114,11 @@ def add_to_cart(request, product_id):
         else:
             return JsonResponse({'error': 'Недостаточно товара на складе'}, status=400)
 
+    reset_cart_count(request)
     return JsonResponse({
         'success': True,
         'message': 'Товар добавлен в корзину',
-        'cart_count': CartItem.objects.filter(user=request.user).count()
+        'cart_count': get_cart_count(request)
     })
 
 
@@ -125,15 +128,74 @@ def remove_from_cart(request, item_id):
     """Удаление товара из корзины"""
     cart_item = get_object_or_404(CartItem, id=item_id, user=request.user)
     cart_item.delete()
+    reset_cart_count(request)
 
     messages.success(request, 'Товар удален из корзины')
     return redirect('cart')
 
 
+class InsufficientStock(Exception):
+    """На складе не хватает товара из корзины"""
+
+
+def _place_order(user, form):
+    """
+    Создать заказ из корзины пользователя в одной транзакции. Число запросов
+    не зависит от размера корзины. InsufficientStock - ничего не меняется.
+    """
+    with transaction.atomic():
+        cart_items = list(CartItem.objects.filter(user=user).order_by('product_id'))
+        quantities = {item.product_id: item.quantity for item in cart_items}
+
+        # Блокировка товаров в порядке id: параллельные заказы не ждут друг друга по кругу
+        products = Product.objects.select_for_update().filter(pk__in=quantities).order_by('pk').in_bulk()
+        for item in cart_items:
+            product = products.get(item.product_id)
+            if product is None or product.stock_quantity < item.quantity:
+                raise InsufficientStock(product.name if product else '')
+            item.product = product
+
+        total = sum(item.total_price for item in cart_items)
+        order = Order(
+            user=user,
+            total_amount=total,
+            shipping_address=form.cleaned_data['shipping_address'],
+            billing_address=form.cleaned_data.get('billing_address', ''),
+        )
+        order.save()
+
+        # bulk_create не вызывает OrderItem.save - итог позиции считается здесь
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=item.product,
+                quantity=item.quantity,
+                unit_price=item.product.price,
+                total_price=item.total_price
+            )
+            for item in cart_items
+        ])
+
+        # Уменьшение количества на складе одним UPDATE (условие - страховка поверх блокировки)
+        enough = Q()
+        for product_id, quantity in quantities.items():
+            enough |= Q(pk=product_id, stock_quantity__gte=quantity)
+        updated = Product.objects.filter(enough).update(stock_quantity=Case(
+            *[When(pk=product_id, then=F('stock_quantity') - quantity) for product_id, quantity in quantities.items()],
+            default=F('stock_quantity')
+        ))
+        if updated != len(quantities):
+            raise InsufficientStock('')
+
+        # Очистка корзины
+        CartItem.objects.filter(user=user).delete()
+    return order, total
+
+
 @login_required
 def checkout(request):
     """Оформление заказа"""
-    cart_items = CartItem.objects.filter(user=request.user)
+    cart_items = CartItem.objects.filter(user=request.user).select_related('product')
 
     if not cart_items:
         messages.warning(request, 'Ваша корзина пуста')
@@ -150,31 +212,15 @@ def checkout(request):
     if request.method == 'POST':
         form = OrderForm(request.POST)
         if form.is_valid():
-            # Создание заказа
-            order = Order(
-                user=request.user,
-                total_amount=total,
-                shipping_address=form.cleaned_data['shipping_address'],
-                billing_address=form.cleaned_data.get('billing_address', ''),
-            )
-            order.save()
-
-            # Создание позиций заказа и обновление количества на складе
-            for cart_item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    quantity=cart_item.quantity,
-                    unit_price=cart_item.product.price,
-                    total_price=cart_item.total_price
-                )
-
-                # Уменьшение количества на складе
-                cart_item.product.stock_quantity -= cart_item.quantity
-                cart_item.product.save()
-
-            # Очистка корзины
-            cart_items.delete()
+            try:
+                order, total = _place_order(request.user, form)
+            except InsufficientStock as e:
+                if str(e):
+                    messages.error(request, f'Товар "{e}" недоступен в нужном количестве')
+                else:
+                    messages.error(request, 'Часть товаров недоступна в нужном количестве')
+                return redirect('cart')
+            reset_cart_count(request)
 
             # Логирование
             SystemLog.objects.create(
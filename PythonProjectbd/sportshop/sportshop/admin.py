@@ -3,12 +3,13 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
 from .models import (
-    Category, Product, ProductImage, Review,
-    Cart, CartItem, Order, OrderItem,
+    Category, Brand, Product, ProductImage, Review,
+    Cart, CartItem, StockReservation, Order, OrderItem, Job,
     UserProfile, Address
 )
 from django.contrib import messages
 from django.http import HttpResponseRedirect
+from . import jobs
 
 
 # Регистрация UserProfile как inline в User
@@ -53,10 +54,16 @@ class CategoryAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(Brand)
+class BrandAdmin(admin.ModelAdmin):
+    list_display = ['name', 'created_at']
+    search_fields = ['name']
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'category', 'price', 'discount_price', 'in_stock', 'created_at']
-    list_filter = ['category', 'in_stock', 'is_active']
+    list_display = ['name', 'category', 'brand', 'price', 'discount_price', 'in_stock', 'created_at']
+    list_filter = ['category', 'brand', 'in_stock', 'is_active']
     search_fields = ['name', 'description', 'sku']
     list_editable = ['price', 'discount_price', 'in_stock']
     prepopulated_fields = {'slug': ('name',)}
@@ -162,6 +169,25 @@ class CartItemAdmin(admin.ModelAdmin):
         return request.user.is_superuser or request.user.groups.filter(name='administrator').exists()
 
 
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['user', 'product', 'quantity', 'expires_at', 'created_at']
+    list_select_related = ['user', 'product']
+    search_fields = ['user__username', 'product__name']
+    # Резервы меняются только вместе со счетчиком товара (reservations.py)
+    readonly_fields = ['user', 'product', 'quantity', 'expires_at', 'created_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def has_module_permission(self, request):
+        # Только суперадмины и администраторы видят резервы
+        return request.user.is_superuser or request.user.groups.filter(name='administrator').exists()
+
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'phone', 'bonus_points', 'total_orders', 'total_spent']
@@ -181,4 +207,28 @@ class AddressAdmin(admin.ModelAdmin):
 
     def has_module_permission(self, request):
         # Только суперадмины и администраторы видят адреса
-        return request.user.is_superuser or request.user.groups.filter(name='administrator').exists()
\ No newline at end of file
+        return request.user.is_superuser or request.user.groups.filter(name='administrator').exists()
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'priority', 'attempts', 'run_at', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'last_error']
+    readonly_fields = [
+        'name', 'payload', 'status', 'priority', 'run_at', 'attempts', 'max_attempts',
+        'last_error', 'locked_by', 'locked_at', 'created_at', 'finished_at',
+    ]
+    actions = ['retry_jobs']
+
+    @admin.action(description='Перезапустить выбранные задания')
+    def retry_jobs(self, request, queryset):
+        count = jobs.retry(queryset)
+        messages.success(request, f'Перезапущено заданий: {count}')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_module_permission(self, request):
+        # Только суперадмины и администраторы видят очередь заданий
+        return request.user.is_superuser or request.user.groups.filter(name='administrator').exists()
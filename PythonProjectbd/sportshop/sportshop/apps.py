@@ -6,4 +6,5 @@ class SportshopConfig(AppConfig):
     name = 'sportshop'
 
     def ready(self):
-        import sportshop.signals
\ No newline at end of file
+        import sportshop.signals
+        import sportshop.tasks
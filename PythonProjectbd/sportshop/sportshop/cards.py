@@ -0,0 +1,79 @@
+# sportshop/cards.py
+"""
+Кеш готового HTML карточек товаров в списках (каталог, поиск, главная).
+
+Ключ карточки складывается из вида карточки, хеша исходника ее шаблона,
+поколения (меняется при изменении категорий и брендов), id товара и
+updated_at. Любое изменение товара или шаблона дает новый ключ, поэтому
+явный сброс отдельных карточек не нужен.
+
+Карточки страницы читаются одним get_many, шаблон рендерится только для
+отсутствующих в кеше.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+
+PRODUCT_CARD_TIMEOUT = getattr(settings, 'PRODUCT_CARD_TIMEOUT', 60 * 60 * 24)
+
+CARD_TEMPLATES = {
+    'catalog': 'sportshop/cards/catalog.html',
+    'advanced': 'sportshop/cards/advanced.html',
+    'search': 'sportshop/cards/search.html',
+    'featured': 'sportshop/cards/featured.html',
+    'discounted': 'sportshop/cards/discounted.html',
+}
+
+GENERATION_KEY = 'cards:generation'
+
+_templates = {}
+
+
+def _template(variant):
+    """Шаблон карточки и хеш его исходника (считается один раз на процесс)"""
+    if variant not in _templates:
+        template = get_template(CARD_TEMPLATES[variant])
+        digest = hashlib.md5(template.template.source.encode('utf-8')).hexdigest()[:8]
+        _templates[variant] = (template, digest)
+    return _templates[variant]
+
+
+def _card_key(variant, digest, generation, product):
+    updated = int(product.updated_at.timestamp() * 1000000) if product.updated_at else 0
+    return f'card:{variant}:{digest}:{generation}:{product.pk}:{updated}'
+
+
+def render_cards(products, variant):
+    """HTML карточек товаров в порядке products"""
+    products = list(products)
+    if not products:
+        return []
+
+    template, digest = _template(variant)
+    generation = cache.get(GENERATION_KEY, 0)
+    keys = [_card_key(variant, digest, generation, product) for product in products]
+    cached = cache.get_many(keys)
+
+    missing = {}
+    cards = []
+    for key, product in zip(keys, products):
+        html = cached.get(key)
+        if html is None:
+            html = missing[key] = template.render({'product': product})
+        cards.append(mark_safe(html))
+
+    if missing:
+        cache.set_many(missing, PRODUCT_CARD_TIMEOUT)
+    return cards
+
+
+def invalidate():
+    """Сбросить все карточки (изменились категории или бренды)"""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
@@ -0,0 +1,122 @@
+# sportshop/cart_summary.py
+"""
+Итоги корзины текущего пользователя (количество и сумма со скидками).
+
+Считаются одним агрегатным запросом (CartItemQuerySet.totals) и
+сохраняются в сессии вместе с версией корзины. Версия хранится в кеше по
+id пользователя и увеличивается при любом изменении позиций (сигналы
+CartItem), поэтому страницы, не меняющие корзину, выводят счетчик без
+запросов к базе. Сумма зависит и от цен товаров, поэтому сохраненные итоги
+живут не дольше CART_SUMMARY_MAX_AGE секунд. Владелец корзины не меняется,
+поэтому соответствие корзина -> пользователь для сигналов CartItem тоже
+хранится в кеше: удаление позиций не ищет корзину каждой позиции запросом.
+
+В пределах запроса итоги запоминаются на объекте запроса: представления,
+шаблоны и контекстный процессор используют один результат. Представления,
+изменяющие корзину, сбрасывают его через reset_cart_summary.
+"""
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Cart, CartItem
+from . import shopping_cart
+
+
+CART_SUMMARY_MAX_AGE = getattr(settings, 'CART_SUMMARY_MAX_AGE', 300)
+
+CART_SUMMARY_SESSION_KEY = 'cart_summary'
+
+EMPTY_SUMMARY = {'quantity': 0, 'total': Decimal('0')}
+
+
+def _version_key(user_id):
+    return f'cart:version:{user_id}'
+
+
+def _owner_key(cart_id):
+    return f'cart:owner:{cart_id}'
+
+
+def cart_version(user_id):
+    """Текущая версия корзины пользователя"""
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Версия, созданная заново после вытеснения ключа, не совпадет со старой
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_cart(user_id):
+    """Пометить сохраненные итоги корзины пользователя устаревшими"""
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+def invalidate_item_cart(item):
+    """Сброс итогов корзины, в которой изменилась позиция"""
+    if CartItem.cart.is_cached(item):
+        user_id = item.cart.user_id
+    else:
+        key = _owner_key(item.cart_id)
+        user_id = cache.get(key)
+        if user_id is None:
+            user_id = Cart.objects.filter(pk=item.cart_id).values_list('user_id', flat=True).first()
+            if user_id is not None:
+                cache.set(key, user_id, None)
+    if user_id is not None:
+        invalidate_cart(user_id)
+
+
+def _stored_summary(session, version):
+    stored = session.get(CART_SUMMARY_SESSION_KEY)
+    if not stored or stored.get('version') != version:
+        return None
+    if time.time() - stored.get('time', 0) > CART_SUMMARY_MAX_AGE:
+        return None
+    return {'quantity': stored['quantity'], 'total': Decimal(stored['total'])}
+
+
+def get_cart_summary(request):
+    """Итоги корзины: {'quantity': ..., 'total': ...}"""
+    summary = getattr(request, '_cart_summary', None)
+    if summary is not None:
+        return summary
+
+    if not request.user.is_authenticated:
+        # Корзина анонимного посетителя хранится в самой сессии (shopping_cart.py)
+        session = getattr(request, 'session', None)
+        if session is not None and session.get(shopping_cart.SESSION_CART_KEY):
+            summary = shopping_cart.SessionCart(session).totals()
+        else:
+            summary = dict(EMPTY_SUMMARY)
+    else:
+        session = getattr(request, 'session', None)
+        version = cart_version(request.user.pk)
+        summary = _stored_summary(session, version) if session is not None else None
+        if summary is None:
+            summary = CartItem.objects.filter(cart__user=request.user).totals()
+            if session is not None:
+                session[CART_SUMMARY_SESSION_KEY] = {
+                    'quantity': summary['quantity'],
+                    'total': str(summary['total']),
+                    'version': version,
+                    'time': time.time(),
+                }
+
+    request._cart_summary = summary
+    return summary
+
+
+def reset_cart_summary(request):
+    """Сбросить запомненные итоги после изменения корзины"""
+    request.__dict__.pop('_cart_summary', None)
+    session = getattr(request, 'session', None)
+    if session is not None:
+        session.pop(CART_SUMMARY_SESSION_KEY, None)
@@ -0,0 +1,328 @@
+# sportshop/catalog_engine.py
+"""
+Необязательный движок каталога в памяти процесса (включается настройкой
+CATALOG_ENGINE_ENABLED, требует NumPy).
+
+Активные товары загружаются в столбцы NumPy (цена, итоговая цена, рейтинг,
+просмотры, дата создания, категория, бренд, остаток). Фильтры
+вычисляются векторными масками, порядок для каждой сортировки - одна
+заранее посчитанная перестановка, из базы загружаются только товары
+текущей страницы (in_bulk).
+
+Курсоры совместимы с KeysetPaginator: ссылку, выданную движком, может
+обработать процесс без движка, и наоборот. Изменения подтягиваются опросом
+updated_at раз в CATALOG_ENGINE_POLL_INTERVAL секунд. updated_at ставится при
+записи строки, а не при фиксации транзакции, поэтому опрос захватывает
+последние CATALOG_ENGINE_POLL_OVERLAP секунд до предыдущей отметки: строка
+долгой транзакции (списание при оформлении заказа) видна, даже если ее
+отметка старше предыдущего опроса. Повторно прочитанные строки без
+изменений не применяются. Удаление товара увеличивает версию в кеше, и
+процессы перезагружают столбцы при следующем опросе; полная перезагрузка
+также раз в CATALOG_ENGINE_RELOAD_INTERVAL секунд (просмотры).
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Product
+from .pagination import CURSOR_PARAM, FORWARD, BACKWARD, KeysetPage, decode_cursor, encode_cursor
+
+try:
+    import numpy as np
+except ImportError:  # движок необязателен
+    np = None
+
+
+CATALOG_ENGINE_ENABLED = getattr(settings, 'CATALOG_ENGINE_ENABLED', False)
+CATALOG_ENGINE_POLL_INTERVAL = getattr(settings, 'CATALOG_ENGINE_POLL_INTERVAL', 5)
+CATALOG_ENGINE_RELOAD_INTERVAL = getattr(settings, 'CATALOG_ENGINE_RELOAD_INTERVAL', 3600)
+# Наибольшая длительность транзакции, изменяющей товары, секунд
+CATALOG_ENGINE_POLL_OVERLAP = getattr(settings, 'CATALOG_ENGINE_POLL_OVERLAP', 60)
+
+DELETED_VERSION_KEY = 'catalog_engine:deleted'
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+LOAD_FIELDS = (
+    'id', 'price', 'effective_price', 'discount_price', 'rating', 'views', 'created_at',
+    'category_id', 'brand_id', 'stock_quantity', 'in_stock', 'is_active', 'updated_at',
+)
+
+# Поля сортировки, которые может обработать движок
+SORTABLE = {'id', 'price', 'effective_price', 'rating', 'views', 'created_at'}
+
+
+def is_enabled():
+    return CATALOG_ENGINE_ENABLED and np is not None
+
+
+# ==================== ПРЕОБРАЗОВАНИЕ ЗНАЧЕНИЙ ====================
+def _hundredths(value):
+    """Цена и рейтинг хранятся целыми сотыми"""
+    return int(Decimal(str(value)) * 100)
+
+
+def _microseconds(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _to_column(field, value):
+    """Значение из курсора -> значение столбца"""
+    if field in ('price', 'effective_price', 'rating'):
+        return _hundredths(value)
+    if field == 'created_at':
+        return _microseconds(value)
+    return int(value)
+
+
+def _from_column(field, value):
+    """Значение столбца -> значение для курсора (как у KeysetPaginator)"""
+    value = int(value)
+    if field in ('price', 'effective_price', 'rating'):
+        return Decimal(value) / 100
+    if field == 'created_at':
+        return EPOCH + timedelta(microseconds=value)
+    return value
+
+
+class CatalogColumns:
+    """Столбцы товаров и перестановки для сортировок"""
+
+    def __init__(self, rows):
+        size = len(rows)
+
+        self.id = np.empty(size, dtype=np.int64)
+        self.price = np.empty(size, dtype=np.int64)
+        self.effective_price = np.empty(size, dtype=np.int64)
+        self.rating = np.empty(size, dtype=np.int64)
+        self.views = np.empty(size, dtype=np.int64)
+        self.created_at = np.empty(size, dtype=np.int64)
+        self.category_id = np.empty(size, dtype=np.int64)
+        self.brand_id = np.empty(size, dtype=np.int64)
+        self.stock_quantity = np.empty(size, dtype=np.int64)
+        self.has_discount = np.empty(size, dtype=bool)
+        self.visible = np.empty(size, dtype=bool)
+
+        self.positions = {}
+        self.row_updated = {}
+        self.last_updated = None
+        for position, row in enumerate(rows):
+            self._set_row(position, row)
+
+        self._permutations = {}
+        self._lock = threading.Lock()
+
+    def _set_row(self, position, row):
+        (product_id, price, effective_price, discount_price, rating, views, created_at,
+         category_id, brand_id, stock_quantity, in_stock, is_active, updated_at) = row
+
+        self.id[position] = product_id
+        self.price[position] = _hundredths(price)
+        self.effective_price[position] = _hundredths(effective_price)
+        self.rating[position] = _hundredths(rating)
+        self.views[position] = views
+        self.created_at[position] = _microseconds(created_at)
+        self.category_id[position] = category_id
+        # -1 - бренд не указан
+        self.brand_id[position] = brand_id if brand_id is not None else -1
+        self.stock_quantity[position] = stock_quantity
+        self.has_discount[position] = discount_price is not None
+        self.visible[position] = is_active and in_stock
+
+        self.positions[product_id] = position
+        self.row_updated[product_id] = updated_at
+        if self.last_updated is None or updated_at > self.last_updated:
+            self.last_updated = updated_at
+
+    def updated(self, rows):
+        """Новые столбцы с изменениями rows (текущий объект не меняется)"""
+        rows = [row for row in rows if self.row_updated.get(row[0]) != row[-1]]
+        if not rows:
+            return self
+        new_rows = [row for row in rows if row[0] not in self.positions]
+        columns = object.__new__(CatalogColumns)
+        for name in ('id', 'price', 'effective_price', 'rating', 'views', 'created_at',
+                     'category_id', 'brand_id', 'stock_quantity', 'has_discount', 'visible'):
+            column = getattr(self, name)
+            extra = np.zeros(len(new_rows), dtype=column.dtype)
+            setattr(columns, name, np.concatenate([column, extra]))
+        columns.positions = dict(self.positions)
+        columns.row_updated = dict(self.row_updated)
+        columns.last_updated = self.last_updated
+
+        next_position = len(self.id)
+        for row in rows:
+            position = columns.positions.get(row[0])
+            if position is None:
+                position = next_position
+                next_position += 1
+            columns._set_row(position, row)
+
+        columns._permutations = {}
+        columns._lock = threading.Lock()
+        return columns
+
+    def _column(self, field):
+        return getattr(self, field)
+
+    def permutation(self, ordering):
+        """Порядок строк для сортировки (считается один раз на версию столбцов)"""
+        permutation = self._permutations.get(ordering)
+        if permutation is None:
+            keys = []
+            for field in reversed(ordering):
+                column = self._column(field.lstrip('-'))
+                keys.append(-column if field.startswith('-') else column)
+            permutation = np.lexsort(keys)
+            with self._lock:
+                self._permutations[ordering] = permutation
+        return permutation
+
+    def mask(self, category_id=None, price_min=None, price_max=None, brand=None, has_discount=False):
+        """Маска товаров, проходящих фильтры (цена - с учетом скидки)"""
+        mask = self.visible.copy()
+        if category_id is not None:
+            mask &= self.category_id == category_id
+        if price_min is not None:
+            mask &= self.effective_price >= _hundredths(price_min)
+        if price_max is not None:
+            mask &= self.effective_price <= _hundredths(price_max)
+        if brand is not None:
+            mask &= self.brand_id == brand
+        if has_discount:
+            mask &= self.has_discount
+        return mask
+
+    def after_cursor(self, fields, values, backward):
+        """Маска "строго после курсора" (то же условие, что KeysetPaginator._after)"""
+        after = np.zeros(len(self.id), dtype=bool)
+        equal = np.ones(len(self.id), dtype=bool)
+        for (field, descending), value in zip(fields, values):
+            column = self._column(field)
+            value = _to_column(field, value)
+            if descending != backward:
+                after |= equal & (column < value)
+            else:
+                after |= equal & (column > value)
+            equal &= column == value
+        return after
+
+    def key(self, fields, position):
+        return [_from_column(field, self._column(field)[position]) for field, _ in fields]
+
+
+class CatalogEngine:
+    """Столбцы каталога с инкрементальным обновлением"""
+
+    def __init__(self):
+        self.columns = None
+        self.loaded_at = 0
+        self.polled_at = 0
+        self.deleted_version = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        self.deleted_version = cache.get(DELETED_VERSION_KEY, 0)
+        rows = list(Product.objects.filter(is_active=True).order_by().values_list(*LOAD_FIELDS).iterator())
+        self.columns = CatalogColumns(rows)
+        self.loaded_at = self.polled_at = time.monotonic()
+
+    def _poll(self):
+        if cache.get(DELETED_VERSION_KEY, 0) != self.deleted_version:
+            # Товары удалены: строк для сравнения нет, столбцы загружаются заново
+            self._load()
+            return
+        columns = self.columns
+        changed = Product.objects.order_by()
+        if columns.last_updated is not None:
+            # Окно перекрытия: строки транзакций, зафиксированных после прошлого опроса
+            changed = changed.filter(
+                updated_at__gte=columns.last_updated - timedelta(seconds=CATALOG_ENGINE_POLL_OVERLAP)
+            )
+        rows = list(changed.values_list(*LOAD_FIELDS))
+        if rows:
+            self.columns = columns.updated(rows)
+        self.polled_at = time.monotonic()
+
+    def get_columns(self):
+        now = time.monotonic()
+        if self.columns is None or now - self.loaded_at > CATALOG_ENGINE_RELOAD_INTERVAL:
+            with self._lock:
+                if self.columns is None or now - self.loaded_at > CATALOG_ENGINE_RELOAD_INTERVAL:
+                    self._load()
+        elif now - self.polled_at > CATALOG_ENGINE_POLL_INTERVAL:
+            with self._lock:
+                if now - self.polled_at > CATALOG_ENGINE_POLL_INTERVAL:
+                    self._poll()
+        return self.columns
+
+
+_engine = CatalogEngine()
+
+
+def product_deleted():
+    """Пометить столбцы всех процессов устаревшими (удаленные товары опросом не видны)"""
+    try:
+        cache.incr(DELETED_VERSION_KEY)
+    except ValueError:
+        cache.set(DELETED_VERSION_KEY, 1, None)
+
+
+def get_page(request, ordering, per_page, **filters):
+    """
+    Страница каталога и общее количество: (KeysetPage, count).
+    Возвращает None, если сортировка не поддерживается движком.
+    """
+    ordering = tuple(ordering)
+    fields = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+    if not is_enabled() or any(field not in SORTABLE for field, _ in fields):
+        return None
+
+    columns = _engine.get_columns()
+    mask = columns.mask(**filters)
+    total = int(mask.sum())
+
+    direction, values = decode_cursor(request.GET.get(CURSOR_PARAM), len(fields))
+    backward = direction == BACKWARD
+    if values is not None:
+        try:
+            mask &= columns.after_cursor(fields, values, backward)
+        except (TypeError, ValueError):
+            values, backward = None, False
+
+    permutation = columns.permutation(ordering)
+    if backward:
+        permutation = permutation[::-1]
+    positions = permutation[np.flatnonzero(mask[permutation])[:per_page + 1]]
+
+    has_more = len(positions) > per_page
+    positions = list(positions[:per_page])
+    if backward:
+        positions.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, values is not None
+
+    # Из базы загружаются только товары страницы
+    ids = [int(columns.id[position]) for position in positions]
+    products = Product.objects.select_related('category', 'brand').in_bulk(ids)
+    rows = [products[pk] for pk in ids if pk in products]
+
+    next_cursor = encode_cursor(FORWARD, columns.key(fields, positions[-1])) if has_next and positions else None
+    previous_cursor = encode_cursor(BACKWARD, columns.key(fields, positions[0])) if has_previous and positions else None
+
+    page = KeysetPage(
+        rows,
+        has_next=has_next and next_cursor is not None,
+        has_previous=has_previous and previous_cursor is not None,
+        next_cursor=next_cursor,
+        previous_cursor=previous_cursor,
+        query_params=request.GET,
+    )
+    return page, total
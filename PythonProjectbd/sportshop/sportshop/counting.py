@@ -0,0 +1,252 @@
+# sportshop/counting.py
+"""
+Подсчет количества записей для списков и статистики.
+
+Каждый уникальный фильтр считается один раз за запрос (мемоизация на объекте
+request) и кешируется на COUNT_CACHE_TIMEOUT секунд. Ключ строится по SQL
+запроса без сортировки, поэтому одинаковые наборы фильтров дают одинаковый
+ключ независимо от порядка параметров в URL.
+Для таблиц без фильтров на MySQL используется оценка из статистики таблицы,
+если она превышает COUNT_ESTIMATE_THRESHOLD.
+
+Количество активных товаров категории хранится в Category.active_product_count
+и обновляется инкрементально при сохранении и удалении товаров. Рейтинг и
+количество отзывов товара хранятся в Product.rating и Product.review_count.
+"""
+import hashlib
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Avg, Case, Count, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+
+from .models import Category, Product, Review
+
+
+COUNT_CACHE_TIMEOUT = getattr(settings, 'COUNT_CACHE_TIMEOUT', 30)
+COUNT_ESTIMATE_THRESHOLD = getattr(settings, 'COUNT_ESTIMATE_THRESHOLD', 100000)
+
+
+def _query_key(queryset, suffix=''):
+    """Ключ кеша по SQL запроса (сортировка не влияет на количество)"""
+    sql, params = queryset.order_by().query.sql_with_params()
+    raw = f'{queryset.db}:{sql}:{params!r}:{suffix}'
+    return 'count:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def _memoized(request, key, compute, timeout):
+    """Значение из памяти запроса, затем из кеша, иначе вычисляем"""
+    memo = None
+    if request is not None:
+        memo = getattr(request, '_count_memo', None)
+        if memo is None:
+            memo = request._count_memo = {}
+        if key in memo:
+            return memo[key]
+
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+
+    if memo is not None:
+        memo[key] = value
+    return value
+
+
+def cached_count(queryset, request=None, timeout=COUNT_CACHE_TIMEOUT):
+    """COUNT(*) для выборки с кешированием"""
+    try:
+        key = _query_key(queryset)
+    except EmptyResultSet:
+        return 0
+    return _memoized(request, key, queryset.count, timeout)
+
+
+def cached_aggregate(queryset, request=None, timeout=COUNT_CACHE_TIMEOUT, **aggregates):
+    """aggregate() для выборки с кешированием (несколько агрегатов одним запросом)"""
+    try:
+        key = _query_key(queryset, suffix=repr(sorted(aggregates.items())))
+    except EmptyResultSet:
+        return queryset.none().aggregate(**aggregates)
+    return _memoized(request, key, lambda: queryset.aggregate(**aggregates), timeout)
+
+
+def cached_group_count(queryset, field, request=None, timeout=COUNT_CACHE_TIMEOUT):
+    """Количество записей по значениям поля одним GROUP BY: {значение: количество}"""
+    grouped = queryset.order_by().values(field).annotate(total=Count('pk'))
+    try:
+        key = _query_key(grouped, suffix='group')
+    except EmptyResultSet:
+        return {}
+    return _memoized(
+        request, key,
+        lambda: {row[field]: row['total'] for row in grouped},
+        timeout
+    )
+
+
+def table_count(model, request=None, threshold=COUNT_ESTIMATE_THRESHOLD, timeout=COUNT_CACHE_TIMEOUT):
+    """
+    Количество строк в таблице без фильтров.
+    Для больших таблиц MySQL возвращает оценку из information_schema
+    (точный COUNT(*) по InnoDB читает весь индекс).
+    """
+    manager = model._default_manager
+    db_table = model._meta.db_table
+
+    def compute():
+        connection = connections[manager.db]
+        if connection.vendor == 'mysql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                    [db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] and row[0] >= threshold:
+                return int(row[0])
+        return manager.count()
+
+    return _memoized(request, f'count:table:{db_table}', compute, timeout)
+
+
+def listing_count(queryset, request=None):
+    """Количество для списка: без фильтров - по таблице (с оценкой), иначе точный COUNT"""
+    if not queryset.query.where:
+        return table_count(queryset.model, request)
+    return cached_count(queryset, request)
+
+
+# ==================== СЧЕТЧИКИ КАТЕГОРИЙ ====================
+_UNKNOWN = object()
+
+
+def _decremented(delta, **condition):
+    """
+    Счетчик минус delta, но не меньше 0. Условие вместо Greatest(F - delta, 0):
+    в MySQL беззнаковое выражение F - delta выходит за диапазон раньше, чем
+    вычисляется Greatest
+    """
+    return When(active_product_count__gte=delta, then=F('active_product_count') - delta, **condition)
+
+
+def _adjust_category(category_id, delta):
+    if category_id is None:
+        return
+    if delta >= 0:
+        value = F('active_product_count') + delta
+    else:
+        value = Case(_decremented(-delta), default=Value(0), output_field=PositiveIntegerField())
+    Category.objects.filter(pk=category_id).update(active_product_count=value)
+
+
+def remember_product_state(product):
+    """Запомнить, в какой категории учтен товар (если неизвестно после загрузки)"""
+    if getattr(product, '_counted_category_id', _UNKNOWN) is not _UNKNOWN:
+        return
+    if product._state.adding or product.pk is None:
+        product._counted_category_id = None
+        return
+    previous = Product.objects.filter(pk=product.pk).values(
+        'category_id', 'is_active', 'in_stock'
+    ).first()
+    if previous and previous['is_active'] and previous['in_stock']:
+        product._counted_category_id = previous['category_id']
+    else:
+        product._counted_category_id = None
+
+
+def product_saved(product, created=False):
+    """Перенести товар между счетчиками категорий после сохранения"""
+    old = None if created else getattr(product, '_counted_category_id', None)
+    new = product.counted_category_id()
+    if old != new:
+        _adjust_category(old, -1)
+        _adjust_category(new, 1)
+    product._counted_category_id = new
+
+
+def product_deleted(product):
+    """Убрать удаленный товар из счетчика категории"""
+    old = getattr(product, '_counted_category_id', _UNKNOWN)
+    if old is _UNKNOWN:
+        old = product.counted_category_id()
+    _adjust_category(old, -1)
+
+
+def products_sold_out(products):
+    """Убрать распроданные товары из счетчиков категорий (один UPDATE на все категории)"""
+    by_category = Counter(product.counted_category_id() for product in products)
+    by_category.pop(None, None)
+    if not by_category:
+        return
+    category_ids = sorted(by_category)
+    # Расхождение счетчика не должно ломать оформление заказа: не меньше 0
+    Category.objects.filter(pk__in=category_ids).update(active_product_count=Case(
+        *[_decremented(by_category[category_id], pk=category_id) for category_id in category_ids],
+        default=Value(0),
+        output_field=PositiveIntegerField(),
+    ))
+
+
+def reconcile_category_counts():
+    """Пересчитать счетчики всех категорий одним GROUP BY. Возвращает число исправленных"""
+    actual = dict(
+        Product.objects.filter(is_active=True, in_stock=True).order_by()
+        .values_list('category_id').annotate(total=Count('pk'))
+    )
+
+    changed = []
+    for category in Category.objects.only('id', 'active_product_count'):
+        count = actual.get(category.pk, 0)
+        if category.active_product_count != count:
+            category.active_product_count = count
+            changed.append(category)
+
+    Category.objects.bulk_update(changed, ['active_product_count'], batch_size=500)
+    return len(changed)
+
+
+# ==================== РЕЙТИНГ ТОВАРОВ ====================
+def _rating_value(average):
+    return round(Decimal(average or 0), 2)
+
+
+def update_product_rating(product_id):
+    """Пересчитать рейтинг и количество отзывов одного товара"""
+    stats = Review.objects.filter(product_id=product_id, is_published=True).aggregate(
+        average=Avg('rating'), total=Count('pk')
+    )
+    Product.objects.filter(pk=product_id).update(
+        rating=_rating_value(stats['average']),
+        review_count=stats['total'],
+        updated_at=timezone.now(),
+    )
+
+
+def recompute_product_ratings():
+    """Пересчитать рейтинги всех товаров одним агрегирующим запросом. Возвращает число исправленных"""
+    actual = {
+        product_id: (_rating_value(average), total)
+        for product_id, average, total in Review.objects.filter(is_published=True).order_by()
+        .values_list('product_id').annotate(average=Avg('rating'), total=Count('pk'))
+        .values_list('product_id', 'average', 'total')
+    }
+
+    changed = []
+    for product in Product.objects.only('id', 'rating', 'review_count').iterator(chunk_size=1000):
+        rating, total = actual.get(product.pk, (_rating_value(0), 0))
+        if product.rating != rating or product.review_count != total:
+            product.rating = rating
+            product.review_count = total
+            changed.append(product)
+
+    Product.objects.bulk_update(changed, ['rating', 'review_count'], batch_size=500)
+    return len(changed)
+
@@ -0,0 +1,201 @@
+# sportshop/facets.py
+"""
+Фасеты для расширенного поиска: количество товаров по категориям, брендам,
+ценовым диапазонам, скидке и наличию для текущего набора фильтров.
+
+Для каждого значения фасета в памяти процесса хранится битовая карта
+(целое число Python, бит = позиция товара). Товары упорядочены по цене
+с учетом скидки, поэтому любой диапазон цен - непрерывный отрезок битов.
+Количество для фасета = число единиц в AND всех фильтров, кроме фильтра
+самого фасета.
+Карты перестраиваются после изменения товаров (версия в кеше) или по
+истечении FACETS_MAX_AGE секунд.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Product, Category, Brand
+
+
+FACETS_MAX_AGE = getattr(settings, 'FACETS_MAX_AGE', 600)
+
+# Ценовые диапазоны (границы включительно, None - без ограничения)
+PRICE_BUCKETS = getattr(settings, 'FACET_PRICE_BUCKETS', [
+    (None, 1000),
+    (1000, 3000),
+    (3000, 5000),
+    (5000, 10000),
+    (10000, None),
+])
+
+# Поля товара, изменение которых меняет фасеты (остаток учитывается через in_stock)
+FACET_FIELDS = {'category', 'brand', 'price', 'discount_price', 'effective_price', 'in_stock', 'is_active'}
+
+VERSION_KEY = 'facets:version'
+
+
+def _bitmap(positions, size):
+    """Битовая карта из списка позиций"""
+    buffer = bytearray((size + 7) // 8)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _bucket_label(low, high):
+    if low is None:
+        return f'до {high} ₽'
+    if high is None:
+        return f'от {low} ₽'
+    return f'{low} – {high} ₽'
+
+
+class FacetIndex:
+    """Битовые карты значений фасетов по активным товарам"""
+
+    def __init__(self, rows, categories, brands, version):
+        # rows: список (id, категория, id бренда, итоговая цена, цена со скидкой, в наличии)
+        rows.sort(key=lambda row: (row[3], row[0]))
+        size = len(rows)
+
+        self.size = size
+        self.version = version
+        self.built_at = time.monotonic()
+        self.categories = categories
+        self.brand_names = brands
+        self.positions = {}
+        self.prices = []
+
+        category_positions = defaultdict(list)
+        brand_positions = defaultdict(list)
+        discount_positions, in_stock_positions = [], []
+
+        for position, (product_id, category_id, brand_id, price, discount_price, in_stock) in enumerate(rows):
+            self.positions[product_id] = position
+            self.prices.append(price)
+            category_positions[category_id].append(position)
+            if brand_id is not None:
+                brand_positions[brand_id].append(position)
+            if discount_price is not None:
+                discount_positions.append(position)
+            if in_stock:
+                in_stock_positions.append(position)
+
+        self.all_bits = (1 << size) - 1
+        self.category_bits = {key: _bitmap(value, size) for key, value in category_positions.items()}
+        self.brand_bits = {key: _bitmap(value, size) for key, value in brand_positions.items()}
+        self.discount_bits = _bitmap(discount_positions, size)
+        self.in_stock_bits = _bitmap(in_stock_positions, size)
+
+    def is_stale(self, version):
+        return version != self.version or time.monotonic() - self.built_at > FACETS_MAX_AGE
+
+    def ids_bits(self, product_ids):
+        """Битовая карта для произвольного набора товаров (например, текстового поиска)"""
+        positions = self.positions
+        return _bitmap([positions[pk] for pk in product_ids if pk in positions], self.size)
+
+    def price_bits(self, low=None, high=None):
+        """Товары с ценой в диапазоне [low, high]"""
+        start = 0 if low is None else bisect_left(self.prices, low)
+        end = self.size if high is None else bisect_right(self.prices, high)
+        if end <= start:
+            return 0
+        return ((1 << end) - 1) ^ ((1 << start) - 1)
+
+    def counts(self, category=None, brand=None, price_min=None, price_max=None,
+               has_discount=False, in_stock=False, ids=None):
+        """Количество товаров по каждому значению фасетов для набора фильтров"""
+        constraints = {}
+        if category is not None:
+            constraints['category'] = self.category_bits.get(category, 0)
+        if brand is not None:
+            constraints['brand'] = self.brand_bits.get(brand, 0)
+        if price_min is not None or price_max is not None:
+            constraints['price'] = self.price_bits(price_min, price_max)
+        if has_discount:
+            constraints['has_discount'] = self.discount_bits
+        if in_stock:
+            constraints['in_stock'] = self.in_stock_bits
+        if ids is not None:
+            constraints['q'] = ids
+
+        def mask_without(name=None):
+            mask = self.all_bits
+            for key, bits in constraints.items():
+                if key != name:
+                    mask &= bits
+            return mask
+
+        mask = mask_without('category')
+        categories = [
+            {'id': category_id, 'name': name,
+             'count': (mask & self.category_bits.get(category_id, 0)).bit_count()}
+            for category_id, name in self.categories
+        ]
+
+        mask = mask_without('brand')
+        brands = []
+        for brand_id, bits in self.brand_bits.items():
+            count = (mask & bits).bit_count()
+            if count and brand_id in self.brand_names:
+                brands.append({'id': brand_id, 'name': self.brand_names[brand_id], 'count': count})
+        brands.sort(key=lambda item: item['name'].lower())
+
+        mask = mask_without('price')
+        price_buckets = [
+            {'min': low, 'max': high, 'label': _bucket_label(low, high),
+             'count': (mask & self.price_bits(low, high)).bit_count()}
+            for low, high in PRICE_BUCKETS
+        ]
+
+        return {
+            'total': mask_without().bit_count(),
+            'categories': categories,
+            'brands': brands,
+            'price_buckets': price_buckets,
+            'has_discount': (mask_without('has_discount') & self.discount_bits).bit_count(),
+            'in_stock': (mask_without('in_stock') & self.in_stock_bits).bit_count(),
+        }
+
+
+def build_index(version=None):
+    """Построить битовые карты по активным товарам"""
+    rows = list(
+        Product.objects.filter(is_active=True).order_by().values_list(
+            'id', 'category_id', 'brand_id', 'effective_price', 'discount_price', 'in_stock'
+        ).iterator()
+    )
+    categories = list(Category.objects.order_by('name').values_list('id', 'name'))
+    brands = dict(Brand.objects.values_list('id', 'name'))
+    return FacetIndex(rows, categories, brands, version)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """Индекс фасетов текущего процесса (перестраивается при устаревании)"""
+    global _index
+    version = cache.get(VERSION_KEY, 0)
+    index = _index
+    if index is None or index.is_stale(version):
+        with _lock:
+            if _index is None or _index.is_stale(version):
+                _index = build_index(version)
+            index = _index
+    return index
+
+
+def invalidate():
+    """Пометить индексы фасетов всех процессов устаревшими"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
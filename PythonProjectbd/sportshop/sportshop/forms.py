@@ -0,0 +1,18 @@
+# sportshop/forms.py
+from django.contrib.auth.forms import PasswordResetForm
+from django.template import loader
+
+from .jobs import enqueue
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """Сброс пароля: письмо отправляется фоновым заданием, а не в запросе"""
+
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        subject = ''.join(loader.render_to_string(subject_template_name, context).splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html_body = None
+        if html_email_template_name is not None:
+            html_body = loader.render_to_string(html_email_template_name, context)
+        enqueue('send_email', priority=10, subject=subject, body=body, to=[to_email], html_body=html_body)
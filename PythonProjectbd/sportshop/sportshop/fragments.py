@@ -0,0 +1,28 @@
+# sportshop/fragments.py
+"""
+Кеширование общих фрагментов страниц (главная страница).
+
+Фрагменты кешируются тегом {% cache %} с версией в ключе. При изменении
+товаров и категорий версия увеличивается, и все закешированные фрагменты
+становятся недействительными без перебора ключей.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+
+HOME_CACHE_TIMEOUT = getattr(settings, 'HOME_CACHE_TIMEOUT', 600)
+
+HOME_VERSION_KEY = 'fragments:home:version'
+
+
+def home_version():
+    """Текущая версия фрагментов главной страницы"""
+    return cache.get(HOME_VERSION_KEY, 0)
+
+
+def invalidate_home():
+    """Сбросить закешированные фрагменты главной страницы"""
+    try:
+        cache.incr(HOME_VERSION_KEY)
+    except ValueError:
+        cache.set(HOME_VERSION_KEY, 1, None)
@@ -0,0 +1,149 @@
+# sportshop/idempotency.py
+"""
+Ключи идемпотентности для изменяющих запросов (оформление заказа, корзина).
+
+Клиент передает ключ в заголовке X-Idempotency-Key (AJAX) или в скрытом
+поле формы idempotency_key. Первый запрос с ключом занимает строку
+IdempotencyKey и сохраняет в ней ответ, повторы (двойная отправка формы,
+повтор после обрыва соединения) получают сохраненный ответ без повторного
+выполнения представления. Ключ действует в пределах пользователя (сессии
+анонимного посетителя) и адреса запроса.
+
+Ответы хранятся IDEMPOTENCY_KEY_TTL секунд, старые строки удаляет команда
+purge_idempotency_keys. Ключ, занятый запросом без ответа дольше
+IDEMPOTENCY_LEASE секунд (процесс упал во время выполнения), считается
+брошенным: повтор занимает его заново, команда очистки удаляет.
+"""
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_KEY_TTL = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+IDEMPOTENCY_LEASE = getattr(settings, 'IDEMPOTENCY_LEASE', 60)
+
+IDEMPOTENCY_HEADER = 'HTTP_X_IDEMPOTENCY_KEY'
+IDEMPOTENCY_FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 100
+
+# Повтор, пришедший во время выполнения первого запроса, ждет его ответа
+WAIT_ATTEMPTS = 20
+WAIT_INTERVAL = 0.25  # секунд
+
+
+def _client_key(request):
+    key = request.META.get(IDEMPOTENCY_HEADER) or request.POST.get(IDEMPOTENCY_FIELD, '')
+    key = key.strip()
+    return key if 0 < len(key) <= MAX_KEY_LENGTH else None
+
+
+def _storage_key(request, client_key):
+    if request.user.is_authenticated:
+        owner = f'user:{request.user.pk}'
+    else:
+        if request.session.session_key is None:
+            request.session.save()
+        owner = f'session:{request.session.session_key}'
+    return hashlib.sha256(f'{owner}:{request.path}:{client_key}'.encode('utf-8')).hexdigest()
+
+
+def _replay(stored):
+    response = HttpResponse(bytes(stored.body), status=stored.status_code, content_type=stored.content_type)
+    if stored.location:
+        response['Location'] = stored.location
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _lease_expired():
+    """Ключи без ответа, занятые раньше этого момента, брошены"""
+    return timezone.now() - timedelta(seconds=IDEMPOTENCY_LEASE)
+
+
+def _claim(key):
+    """Занять ключ. False, если он занят выполняющимся запросом или хранит ответ"""
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(key=key)
+        return True
+    except IntegrityError:
+        # Брошенный ключ занимается заново условным UPDATE - только одним из повторов
+        return bool(
+            IdempotencyKey.objects.filter(key=key, status_code__isnull=True, created_at__lt=_lease_expired())
+            .update(created_at=timezone.now())
+        )
+
+
+def _wait_for_response(key):
+    """Сохраненный ответ по ключу; None, если первый запрос так и не завершился"""
+    for attempt in range(WAIT_ATTEMPTS):
+        stored = IdempotencyKey.objects.filter(key=key).first()
+        if stored is None:
+            # Первый запрос завершился ошибкой и освободил ключ
+            return None
+        if stored.status_code is not None:
+            return stored
+        time.sleep(WAIT_INTERVAL)
+    return None
+
+
+def idempotent(view_func):
+    """
+    Повтор POST-запроса с тем же ключом получает сохраненный ответ.
+    Запросы без ключа выполняются как обычно.
+    """
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        client_key = _client_key(request) if request.method == 'POST' else None
+        if client_key is None:
+            return view_func(request, *args, **kwargs)
+
+        key = _storage_key(request, client_key)
+        if not _claim(key):
+            stored = _wait_for_response(key)
+            if stored is None:
+                return JsonResponse(
+                    {'success': False, 'error': 'Запрос уже выполняется, повторите попытку позже'},
+                    status=409
+                )
+            return _replay(stored)
+
+        try:
+            response = view_func(request, *args, **kwargs)
+        except Exception:
+            IdempotencyKey.objects.filter(key=key).delete()
+            raise
+
+        # Ошибки сервера не запоминаются - повтор выполнит запрос заново
+        if response.status_code >= 500 or response.streaming:
+            IdempotencyKey.objects.filter(key=key).delete()
+            return response
+
+        IdempotencyKey.objects.filter(key=key).update(
+            status_code=response.status_code,
+            content_type=response.get('Content-Type', ''),
+            location=response.get('Location', ''),
+            body=response.content,
+        )
+        return response
+
+    return _wrapped_view
+
+
+def purge_expired():
+    """Удалить сохраненные ответы старше IDEMPOTENCY_KEY_TTL и брошенные ключи. Возвращает количество"""
+    deleted, _ = IdempotencyKey.objects.filter(
+        Q(created_at__lt=timezone.now() - timedelta(seconds=IDEMPOTENCY_KEY_TTL)) |
+        Q(status_code__isnull=True, created_at__lt=_lease_expired())
+    ).delete()
+    return deleted
@@ -0,0 +1,167 @@
+# sportshop/jobs.py
+"""
+Очередь фоновых заданий в базе данных (без внешнего брокера).
+
+Представления ставят задание через enqueue() - строкой Job в той же
+транзакции, что и основные изменения: задание не потеряется и не
+выполнится для откатившегося заказа. Обработчики регистрируются
+декоратором @task (tasks.py) и выполняются командой
+run_workers --concurrency N.
+
+Обработчик берет задание SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+параллельные обработчики не ждут друг друга и не получают одно задание
+дважды. Ошибка - повтор с экспоненциальной задержкой; после max_attempts
+попыток задание остается со статусом dead (просмотр и перезапуск - в
+админке). Задания, взятые упавшим обработчиком, возвращаются в очередь
+через JOB_LOCK_TIMEOUT секунд.
+
+Статус done записывается в транзакции обработчика: изменения задания и
+отметка о выполнении фиксируются вместе, поэтому выполненное задание не
+повторяется после падения процесса. Если задание уже вернули в очередь
+как зависшее, транзакция обработчика откатывается.
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+JOB_MAX_ATTEMPTS = getattr(settings, 'JOB_MAX_ATTEMPTS', 5)
+JOB_RETRY_DELAY = getattr(settings, 'JOB_RETRY_DELAY', 30)  # секунд, удваивается с каждой попыткой
+JOB_MAX_RETRY_DELAY = getattr(settings, 'JOB_MAX_RETRY_DELAY', 60 * 60)
+JOB_LOCK_TIMEOUT = getattr(settings, 'JOB_LOCK_TIMEOUT', 10 * 60)
+JOB_KEEP_DONE = getattr(settings, 'JOB_KEEP_DONE', 7 * 24 * 60 * 60)
+
+_tasks = {}
+
+
+def task(name):
+    """Регистрация обработчика задания: @task('send_email')"""
+    def decorator(func):
+        _tasks[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, priority=0, delay=0, max_attempts=JOB_MAX_ATTEMPTS, **payload):
+    """Поставить задание в очередь (параметры обработчика - payload, значения JSON)"""
+    if name not in _tasks:
+        raise ValueError(f'Неизвестное задание: {name}')
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        priority=priority,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts,
+    )
+
+
+# ==================== ОБРАБОТКА ====================
+def claim(worker):
+    """Взять следующее готовое задание (None, если очередь пуста)"""
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            job = (
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(status=Job.STATUS_PENDING, run_at__lte=now)
+                .order_by('-priority', 'run_at', 'id')
+                .first()
+            )
+            if job is None:
+                return None
+            # Условие по статусу - для баз без SKIP LOCKED (SQLite)
+            claimed = Job.objects.filter(pk=job.pk, status=Job.STATUS_PENDING).update(
+                status=Job.STATUS_RUNNING,
+                locked_by=worker,
+                locked_at=now,
+                attempts=F('attempts') + 1,
+            )
+        if claimed:
+            job.status, job.locked_by, job.locked_at = Job.STATUS_RUNNING, worker, now
+            job.attempts += 1
+            return job
+
+
+class _LockLost(Exception):
+    """Задание больше не принадлежит обработчику (возвращено в очередь как зависшее)"""
+
+
+def _retry_delay(attempts):
+    delay = min(JOB_RETRY_DELAY * 2 ** (attempts - 1), JOB_MAX_RETRY_DELAY)
+    # Разброс, чтобы одновременно упавшие задания не повторялись пачкой
+    return delay + random.uniform(0, delay / 10)
+
+
+def run(job):
+    """Выполнить взятое задание. True при успехе"""
+    handler = _tasks.get(job.name)
+    mine = Job.objects.filter(pk=job.pk, status=Job.STATUS_RUNNING, locked_by=job.locked_by)
+    try:
+        if handler is None:
+            raise LookupError(f'Неизвестное задание: {job.name}')
+        # Изменения обработчика, поставленные им задания и статус done фиксируются вместе
+        with transaction.atomic():
+            handler(**job.payload)
+            done = mine.update(status=Job.STATUS_DONE, locked_by='', locked_at=None, finished_at=timezone.now())
+            if not done:
+                raise _LockLost
+    except _LockLost:
+        logger.warning('Задание %s #%s возвращено в очередь до завершения, изменения отменены', job.name, job.pk)
+        return False
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            logger.error('Задание %s #%s не выполнено после %s попыток', job.name, job.pk, job.attempts)
+            mine.update(status=Job.STATUS_DEAD, last_error=error, locked_by='', locked_at=None, finished_at=now)
+        else:
+            logger.warning('Задание %s #%s завершилось ошибкой, повтор', job.name, job.pk)
+            mine.update(
+                status=Job.STATUS_PENDING,
+                run_at=now + timedelta(seconds=_retry_delay(job.attempts)),
+                last_error=error,
+                locked_by='',
+                locked_at=None,
+            )
+        return False
+    return True
+
+
+# ==================== ОБСЛУЖИВАНИЕ ====================
+def recover_stale():
+    """Вернуть в очередь задания упавших обработчиков. Возвращает количество"""
+    stale = Job.objects.filter(
+        status=Job.STATUS_RUNNING,
+        locked_at__lt=timezone.now() - timedelta(seconds=JOB_LOCK_TIMEOUT),
+    )
+    dead = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.STATUS_DEAD, last_error='Превышено время выполнения', locked_by='', locked_at=None,
+        finished_at=timezone.now(),
+    )
+    return dead + stale.update(status=Job.STATUS_PENDING, locked_by='', locked_at=None)
+
+
+def purge_done():
+    """Удалить выполненные задания старше JOB_KEEP_DONE секунд"""
+    deleted, _ = Job.objects.filter(
+        status=Job.STATUS_DONE,
+        finished_at__lt=timezone.now() - timedelta(seconds=JOB_KEEP_DONE),
+    ).delete()
+    return deleted
+
+
+def retry(queryset):
+    """Перезапустить задания (например, из dead) с обнуленным счетчиком попыток"""
+    return queryset.exclude(status=Job.STATUS_RUNNING).update(
+        status=Job.STATUS_PENDING, attempts=0, run_at=timezone.now(), finished_at=None,
+    )
@@ -0,0 +1,30 @@
+# sportshop/management/commands/backfill_effective_prices.py
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from sportshop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает итоговую цену и процент скидки товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество товаров в одном UPDATE',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_id = Product.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+
+        self.stdout.write('Пересчет итоговых цен...')
+        updated = 0
+        # Диапазонами id, чтобы не блокировать всю таблицу одним запросом
+        for start in range(0, max_id + 1, batch_size):
+            updated += Product.objects.filter(
+                id__gte=start, id__lt=start + batch_size
+            ).refresh_prices()
+        self.stdout.write(self.style.SUCCESS(f'Обновлено товаров: {updated}'))
@@ -0,0 +1,37 @@
+# sportshop/management/commands/build_recommendations.py
+from django.core.management.base import BaseCommand
+
+from sportshop.recommendations import build_recommendations, TOP_K, ORDERS_PER_CHUNK
+
+
+class Command(BaseCommand):
+    help = 'Строит рекомендации "часто покупают вместе" по истории заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=TOP_K,
+            help='Количество рекомендаций на товар',
+        )
+        parser.add_argument(
+            '--min-support',
+            type=int,
+            default=1,
+            help='Минимальное число совместных покупок',
+        )
+        parser.add_argument(
+            '--orders-per-chunk',
+            type=int,
+            default=ORDERS_PER_CHUNK,
+            help='Количество заказов в одной пачке матрицы',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Построение рекомендаций...')
+        products = build_recommendations(
+            top_k=options['top_k'],
+            min_support=options['min_support'],
+            orders_per_chunk=options['orders_per_chunk'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Товаров с рекомендациями: {products}'))
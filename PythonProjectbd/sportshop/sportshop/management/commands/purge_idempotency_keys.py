@@ -0,0 +1,12 @@
+# sportshop/management/commands/purge_idempotency_keys.py
+from django.core.management.base import BaseCommand
+
+from sportshop.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Удаляет устаревшие сохраненные ответы ключей идемпотентности (запускать по расписанию)'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Удалено ключей: {deleted}'))
@@ -0,0 +1,21 @@
+# sportshop/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+
+from sportshop.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки при записи индекса',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Перестройка поискового индекса...')
+        indexed = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано товаров: {indexed}'))
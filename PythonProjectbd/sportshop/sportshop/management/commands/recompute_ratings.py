@@ -0,0 +1,13 @@
+# sportshop/management/commands/recompute_ratings.py
+from django.core.management.base import BaseCommand
+
+from sportshop.counting import recompute_product_ratings
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинг и количество отзывов товаров'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Пересчет рейтингов товаров...')
+        changed = recompute_product_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Обновлено товаров: {changed}'))
@@ -0,0 +1,13 @@
+# sportshop/management/commands/reconcile_category_counts.py
+from django.core.management.base import BaseCommand
+
+from sportshop.counting import reconcile_category_counts
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает количество активных товаров в категориях'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Пересчет счетчиков категорий...')
+        changed = reconcile_category_counts()
+        self.stdout.write(self.style.SUCCESS(f'Исправлено категорий: {changed}'))
@@ -0,0 +1,24 @@
+# sportshop/management/commands/release_expired_reservations.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from sportshop.reservations import sweep_expired, SWEEP_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Освобождает просроченные резервы товаров (запускать по расписанию или с --interval)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE,
+                            help='Резервов в одной транзакции')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Повторять каждые N секунд (0 - один проход)')
+
+    def handle(self, *args, **options):
+        while True:
+            released = sweep_expired(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Освобождено резервов: {released}'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,94 @@
+# sportshop/management/commands/run_workers.py
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, DatabaseError
+
+from sportshop import jobs
+
+
+# Возврат зависших заданий и удаление выполненных, секунд
+MAINTENANCE_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = 'Запускает обработчики фоновых заданий из очереди в базе данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Количество параллельных обработчиков (потоков)')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Пауза между проверками пустой очереди, секунд')
+        parser.add_argument('--burst', action='store_true',
+                            help='Выполнить готовые задания и завершиться')
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        # Остановка по Ctrl+C / SIGTERM: текущие задания доводятся до конца
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: self.stop.set())
+
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        workers = [
+            threading.Thread(
+                target=self.work,
+                args=(f'{prefix}:{number}', options['poll_interval'], options['burst']),
+                daemon=True,
+            )
+            for number in range(max(options['concurrency'], 1))
+        ]
+        self.stdout.write(f'Запуск обработчиков: {len(workers)}')
+
+        self.maintain()
+        for worker in workers:
+            worker.start()
+
+        # Обслуживание очереди - в основном потоке, пока работают обработчики
+        maintained_at = time.monotonic()
+        while any(worker.is_alive() for worker in workers) and not self.stop.wait(1):
+            if time.monotonic() - maintained_at >= MAINTENANCE_INTERVAL:
+                self.maintain()
+                maintained_at = time.monotonic()
+        for worker in workers:
+            worker.join()
+        connection.close()
+        self.stdout.write(self.style.SUCCESS('Обработчики остановлены'))
+
+    def maintain(self):
+        recovered = jobs.recover_stale()
+        if recovered:
+            self.stdout.write(f'Возвращено в очередь зависших заданий: {recovered}')
+        jobs.purge_done()
+
+    def work(self, name, poll_interval, burst):
+        try:
+            while not self.stop.is_set():
+                try:
+                    job = jobs.claim(name)
+                except DatabaseError as e:
+                    # Потеря соединения или блокировка (SQLite): поток продолжает работу
+                    self.stderr.write(f'[{name}] Ошибка базы данных: {e}')
+                    connection.close()
+                    self.stop.wait(poll_interval)
+                    continue
+                if job is None:
+                    if burst:
+                        break
+                    self.stop.wait(poll_interval)
+                    continue
+                try:
+                    ok = jobs.run(job)
+                except DatabaseError as e:
+                    # Соединение потеряно во время задания: его вернет recover_stale
+                    self.stderr.write(f'[{name}] {job.name} #{job.pk}: ошибка базы данных: {e}')
+                    connection.close()
+                    continue
+                status = self.style.SUCCESS('выполнено') if ok else self.style.ERROR('ошибка')
+                self.stdout.write(f'[{name}] {job.name} #{job.pk}: {status}')
+        finally:
+            # У каждого потока свое соединение с базой
+            connection.close()
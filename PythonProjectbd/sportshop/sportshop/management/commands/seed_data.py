@@ -5,7 +5,7 @@ from django.utils import timezone
 from decimal import Decimal
 import random
 from sportshop.models import (
-    Category, Product, ProductImage, UserProfile,
+    Category, Brand, Product, ProductImage, UserProfile,
     Address, Order, OrderItem, Review, Cart, CartItem
 )
 
@@ -224,6 +224,8 @@ class Command(BaseCommand):
         products = []
         for i, data in enumerate(products_data):
             sku = f"PROD-{1000 + i}"
+            if 'brand' in data:
+                data = {**data, 'brand': Brand.get_by_name(data['brand'])}
             product, created = Product.objects.get_or_create(
                 slug=data['slug'],
                 defaults={
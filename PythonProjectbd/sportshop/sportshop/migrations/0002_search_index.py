@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sportshop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='sportshop.product', verbose_name='Товар')),
+                ('length', models.PositiveIntegerField(default=0, verbose_name='Длина документа')),
+            ],
+            options={
+                'verbose_name': 'Поисковый документ',
+                'verbose_name_plural': 'Поисковые документы',
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Термин')),
+                ('tf', models.PositiveIntegerField(default=1, verbose_name='Взвешенная частота')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_postings', to='sportshop.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Вхождение термина',
+                'verbose_name_plural': 'Поисковый индекс',
+                'unique_together': {('term', 'product')},
+            },
+        ),
+    ]
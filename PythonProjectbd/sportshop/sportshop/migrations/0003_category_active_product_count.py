@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:33
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_active_product_count(apps, schema_editor):
+    Category = apps.get_model('sportshop', 'Category')
+    Product = apps.get_model('sportshop', 'Product')
+    counts = (
+        Product.objects.filter(is_active=True, in_stock=True).order_by()
+        .values_list('category_id').annotate(total=Count('pk'))
+    )
+    for category_id, total in counts:
+        Category.objects.filter(pk=category_id).update(active_product_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sportshop', '0002_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_product_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Активных товаров'),
+        ),
+        migrations.RunPython(fill_active_product_count, migrations.RunPython.noop),
+    ]
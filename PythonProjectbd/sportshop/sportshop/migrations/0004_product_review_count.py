@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:34
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Avg, Count
+
+
+def fill_product_ratings(apps, schema_editor):
+    Product = apps.get_model('sportshop', 'Product')
+    Review = apps.get_model('sportshop', 'Review')
+    # Рейтинг считается только по опубликованным отзывам
+    Product.objects.update(rating=0, review_count=0)
+    stats = (
+        Review.objects.filter(is_published=True).order_by()
+        .values_list('product_id').annotate(average=Avg('rating'), total=Count('pk'))
+        .values_list('product_id', 'average', 'total')
+    )
+    for product_id, average, total in stats:
+        Product.objects.filter(pk=product_id).update(
+            rating=round(Decimal(average or 0), 2),
+            review_count=total,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sportshop', '0003_category_active_product_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество отзывов'),
+        ),
+        migrations.RunPython(fill_product_ratings, migrations.RunPython.noop),
+    ]
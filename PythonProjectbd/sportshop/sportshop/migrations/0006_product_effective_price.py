@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:39
+
+from django.db import migrations, models
+from django.db.models import Case, F, Q, When
+from django.db.models.functions import Round
+
+
+def fill_effective_prices(apps, schema_editor):
+    Product = apps.get_model('sportshop', 'Product')
+    has_discount = Q(discount_price__gt=0)
+    Product.objects.update(
+        effective_price=Case(When(has_discount, then=F('discount_price')), default=F('price')),
+        discount_percent=Case(
+            When(
+                has_discount & Q(price__gt=0, discount_price__lt=F('price')),
+                then=Round((F('price') - F('discount_price')) * 100 / F('price')),
+            ),
+            default=0,
+            output_field=models.PositiveSmallIntegerField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sportshop', '0005_product_recommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='discount_percent',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Скидка, %'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='Итоговая цена'),
+        ),
+        migrations.RunPython(fill_effective_prices, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'in_stock', 'effective_price'], name='sportshop_p_is_acti_b96ee5_idx'),
+        ),
+    ]
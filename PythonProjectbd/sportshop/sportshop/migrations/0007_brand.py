@@ -0,0 +1,82 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:41
+
+from collections import Counter, defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def normalize(name):
+    return ' '.join(name.lower().split())
+
+
+def create_brands(apps, schema_editor):
+    """Бренды из текстового поля: варианты написания без учета регистра объединяются"""
+    Product = apps.get_model('sportshop', 'Product')
+    Brand = apps.get_model('sportshop', 'Brand')
+
+    spellings = defaultdict(Counter)
+    product_ids = defaultdict(list)
+    for product_id, value in Product.objects.exclude(brand='').order_by('id').values_list('id', 'brand').iterator():
+        label = ' '.join(value.split())
+        if label:
+            spellings[normalize(label)][label] += 1
+            product_ids[normalize(label)].append(product_id)
+
+    for key, variants in spellings.items():
+        # Название бренда - самый частый вариант написания (при равенстве - самый ранний)
+        brand = Brand.objects.create(name=variants.most_common(1)[0][0], normalized_name=key)
+        ids = product_ids[key]
+        for start in range(0, len(ids), 1000):
+            Product.objects.filter(pk__in=ids[start:start + 1000]).update(brand_ref=brand)
+
+
+def restore_brand_names(apps, schema_editor):
+    Product = apps.get_model('sportshop', 'Product')
+    Brand = apps.get_model('sportshop', 'Brand')
+    for brand in Brand.objects.all():
+        Product.objects.filter(brand_ref=brand).update(brand=brand.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sportshop', '0006_product_effective_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Brand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('normalized_name', models.CharField(editable=False, max_length=100, unique=True, verbose_name='Ключ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Бренд',
+                'verbose_name_plural': 'Бренды',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='brand_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='sportshop.brand'),
+        ),
+        migrations.RunPython(create_brands, restore_brand_names),
+        migrations.RemoveField(
+            model_name='product',
+            name='brand',
+        ),
+        migrations.RenameField(
+            model_name='product',
+            old_name='brand_ref',
+            new_name='brand',
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='brand',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='sportshop.brand', verbose_name='Бренд'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-17 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sportshop', '0009_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('allocated_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата выделения')),
+            ],
+            options={
+                'verbose_name': 'Блок номеров заказов',
+                'verbose_name_plural': 'Блоки номеров заказов',
+            },
+        ),
+    ]
@@ -1,7 +1,10 @@
 from django.db import models
+from django.db.models import Case, F, Sum, When
+from django.db.models.functions import Round
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
+from decimal import Decimal, ROUND_HALF_UP
 import uuid
 
 
@@ -12,6 +15,8 @@ class Category(models.Model):
     description = models.TextField('Описание', blank=True)
     image = models.CharField('Изображение', max_length=100, blank=True, null=True)  # ← ИЗМЕНИТЕ НА CharField
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    # Количество активных товаров в наличии (обновляется сигналами, см. counting.py)
+    active_product_count = models.PositiveIntegerField('Активных товаров', default=0, db_index=True)
 
     class Meta:
         verbose_name = 'Категория'
@@ -22,7 +27,113 @@ class Category(models.Model):
         return self.name
 
     def get_product_count(self):
-        return self.products.count()
+        return self.active_product_count
+
+
+class Brand(models.Model):
+    """Бренды товаров"""
+    name = models.CharField('Название', max_length=100)
+    # Название без учета регистра и лишних пробелов (для поиска дубликатов)
+    normalized_name = models.CharField('Ключ', max_length=100, unique=True, editable=False)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Бренд'
+        verbose_name_plural = 'Бренды'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    @staticmethod
+    def normalize(name):
+        return ' '.join(name.lower().split())
+
+    @classmethod
+    def get_by_name(cls, name):
+        """Бренд по названию без учета регистра (создается, если его нет)"""
+        name = ' '.join(name.split())
+        if not name:
+            return None
+        brand, created = cls.objects.get_or_create(
+            normalized_name=cls.normalize(name),
+            defaults={'name': name}
+        )
+        return brand
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = self.normalize(self.name)
+        super().save(*args, **kwargs)
+
+
+# Поля цены, от которых зависят итоговая цена и процент скидки
+PRICE_FIELDS = {'price', 'discount_price'}
+STORED_PRICE_FIELDS = ['effective_price', 'discount_percent']
+# Поля, массовое изменение которых не сбрасывает кеш товаров (product_cache.py):
+# просмотры и резерв (доступный остаток всегда проверяется запросом к базе)
+UNCACHED_FIELDS = {'views', 'reserved_quantity'}
+# Поля, выводимые в подсказках поиска (suggest.py)
+SUGGEST_FIELDS = ('name', 'brand', 'category', 'is_active', 'in_stock', 'price', 'discount_price', 'image')
+# Массовое изменение большего числа товаров сбрасывает весь кеш товаров одной версией
+PRODUCT_INVALIDATE_MANY_LIMIT = 500
+# Товаров в одном UPDATE пересчета цен после массового изменения
+PRICE_REFRESH_CHUNK_SIZE = 1000
+
+
+class ProductQuerySet(models.QuerySet):
+    """Выборка товаров: массовые изменения цен пересчитывают итоговую цену"""
+
+    @staticmethod
+    def _price_updates():
+        has_discount = models.Q(discount_price__gt=0)
+        return {
+            'effective_price': Case(When(has_discount, then=F('discount_price')), default=F('price')),
+            'discount_percent': Case(
+                When(
+                    has_discount & models.Q(price__gt=0, discount_price__lt=F('price')),
+                    then=Round((F('price') - F('discount_price')) * 100 / F('price')),
+                ),
+                default=0,
+                output_field=models.PositiveSmallIntegerField(),
+            ),
+        }
+
+    def refresh_prices(self):
+        """Пересчитать итоговую цену и процент скидки одним UPDATE"""
+        return self.update(**self._price_updates())
+
+    def update(self, **kwargs):
+        if set(kwargs) <= UNCACHED_FIELDS:
+            return super().update(**kwargs)
+        # Как auto_now при save(): по updated_at обновляются движок каталога и карточки
+        kwargs.setdefault('updated_at', timezone.now())
+        if PRICE_FIELDS & set(kwargs):
+            # Условие выборки может зависеть от изменяемых полей, поэтому запоминаем id до изменения
+            product_ids = list(self.values_list('pk', flat=True))
+            rows = super().update(**kwargs)
+            for start in range(0, len(product_ids), PRICE_REFRESH_CHUNK_SIZE):
+                chunk = self.model._default_manager.filter(pk__in=product_ids[start:start + PRICE_REFRESH_CHUNK_SIZE])
+                models.QuerySet.update(chunk, **self._price_updates())
+        else:
+            # Id нужны только для сброса кеша по товарам: не больше порога
+            product_ids = list(self.values_list('pk', flat=True)[:PRODUCT_INVALIDATE_MANY_LIMIT + 1])
+            rows = super().update(**kwargs)
+
+        from .product_cache import invalidate_many, invalidate_all
+        if len(product_ids) > PRODUCT_INVALIDATE_MANY_LIMIT:
+            invalidate_all()
+        else:
+            invalidate_many(product_ids)
+        return rows
+
+    update.alters_data = True
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if PRICE_FIELDS & set(fields):
+            for obj in objs:
+                obj.compute_prices()
+            fields = list(fields) + [field for field in STORED_PRICE_FIELDS if field not in fields]
+        return super().bulk_update(objs, fields, batch_size=batch_size)
 
 
 class Product(models.Model):
@@ -48,6 +159,9 @@ class Product(models.Model):
         blank=True,
         null=True
     )
+    # Цена с учетом скидки и процент скидки (вычисляются в save, см. compute_prices)
+    effective_price = models.DecimalField('Итоговая цена', max_digits=10, decimal_places=2, default=0, editable=False)
+    discount_percent = models.PositiveSmallIntegerField('Скидка, %', default=0, editable=False)
 
     image = models.ImageField('Основное изображение', upload_to='products/')
     images = models.ManyToManyField(
@@ -58,21 +172,34 @@ class Product(models.Model):
     )
 
     stock_quantity = models.PositiveIntegerField('Количество на складе', default=0)
+    # Сумма активных резервов корзин и оформления (см. reservations.py)
+    reserved_quantity = models.PositiveIntegerField('В резерве', default=0, editable=False)
     in_stock = models.BooleanField('В наличии', default=True)
 
     # Технические характеристики
     weight = models.DecimalField('Вес (кг)', max_digits=6, decimal_places=2, blank=True, null=True)
     dimensions = models.CharField('Размеры (ШxВxГ)', max_length=50, blank=True)
     material = models.CharField('Материал', max_length=100, blank=True)
-    brand = models.CharField('Бренд', max_length=100, blank=True)
+    brand = models.ForeignKey(
+        Brand,
+        verbose_name='Бренд',
+        on_delete=models.SET_NULL,
+        related_name='products',
+        blank=True,
+        null=True
+    )
 
     # Метаданные
     views = models.PositiveIntegerField('Просмотры', default=0)
+    # Средняя оценка и количество опубликованных отзывов (обновляются сигналами отзывов)
     rating = models.DecimalField('Рейтинг', max_digits=3, decimal_places=2, default=0)
+    review_count = models.PositiveIntegerField('Количество отзывов', default=0)
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
     updated_at = models.DateTimeField('Дата обновления', auto_now=True)
     is_active = models.BooleanField('Активный', default=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
@@ -82,21 +209,60 @@ class Product(models.Model):
             models.Index(fields=['category']),
             models.Index(fields=['price']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['is_active', 'in_stock', 'effective_price']),
         ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем состояние для счетчика товаров категории
+        if {'category_id', 'is_active', 'in_stock'} <= set(field_names):
+            instance._counted_category_id = instance.counted_category_id()
+        # И для подсказок поиска: сохранение без их изменения не сбрасывает индекс
+        if {'name', 'brand_id', 'category_id', 'is_active', 'in_stock', 'price', 'discount_price', 'image'} <= set(field_names):
+            instance._suggest_state = instance.suggest_state()
+        # И для фасетов
+        if {'category_id', 'brand_id', 'effective_price', 'discount_price', 'in_stock', 'is_active'} <= set(field_names):
+            instance._facet_state = instance.facet_state()
+        return instance
+
+    def suggest_state(self):
+        """Значения полей, выводимых в подсказках поиска"""
+        return (
+            self.name, self.brand_id, self.category_id, self.is_active, self.in_stock,
+            self.price, self.discount_price, self.image.name,
+        )
+
+    def facet_state(self):
+        """Значения, по которым товар попадает в битовые карты фасетов"""
+        return (
+            self.category_id, self.brand_id, self.effective_price, self.discount_price is None,
+            self.in_stock, self.is_active,
+        )
+
+    def counted_category_id(self):
+        """Категория, в счетчике которой учитывается товар (None - не учитывается)"""
+        return self.category_id if self.is_active and self.in_stock else None
+
     def get_final_price(self):
         """Получить окончательную цену (со скидкой если есть)"""
         return self.discount_price if self.discount_price else self.price
 
     def get_discount_percentage(self):
-        """Рассчитать процент скидки"""
-        if self.discount_price and self.price > 0:
-            discount = ((self.price - self.discount_price) / self.price) * 100
-            return round(discount)
-        return 0
+        """Процент скидки (хранится в поле discount_percent)"""
+        return self.discount_percent
+
+    def compute_prices(self):
+        """Пересчитать итоговую цену и процент скидки"""
+        self.effective_price = self.get_final_price()
+        if self.discount_price and self.price > 0 and self.discount_price < self.price:
+            discount = (self.price - self.discount_price) * 100 / self.price
+            self.discount_percent = int(Decimal(discount).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+        else:
+            self.discount_percent = 0
 
     def get_saving_amount(self):
         """Сколько денег экономит покупатель"""
@@ -108,13 +274,13 @@ class Product(models.Model):
         """Доступен ли товар для заказа"""
         return self.in_stock and self.stock_quantity > 0
 
+    def get_available_quantity(self):
+        """Остаток за вычетом резервов"""
+        return max(self.stock_quantity - self.reserved_quantity, 0)
+
     def get_average_rating(self):
-        """Средний рейтинг товара"""
-        reviews = self.reviews.all()
-        if reviews:
-            total = sum(review.rating for review in reviews)
-            return round(total / len(reviews), 1)
-        return 0
+        """Средний рейтинг товара (по опубликованным отзывам)"""
+        return round(self.rating, 1)
 
     def save(self, *args, **kwargs):
         # Автоматически генерируем артикул если не указан
@@ -124,6 +290,11 @@ class Product(models.Model):
         # Обновляем поле in_stock в зависимости от количества
         self.in_stock = self.stock_quantity > 0
 
+        self.compute_prices()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and PRICE_FIELDS & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | set(STORED_PRICE_FIELDS)
+
         super().save(*args, **kwargs)
 
 
@@ -217,11 +388,11 @@ class Cart(models.Model):
 
     def get_total_quantity(self):
         """Общее количество товаров в корзине"""
-        return sum(item.quantity for item in self.items.all())
+        return self.items.totals()['quantity']
 
     def get_total_price(self):
         """Общая стоимость товаров в корзине"""
-        total = sum(item.get_total_price() for item in self.items.all())
+        total = self.items.totals()['total']
 
         # Применяем скидку если есть
         if hasattr(self, 'coupon') and self.coupon:
@@ -236,6 +407,24 @@ class Cart(models.Model):
             self.coupon.delete()
 
 
+class CartItemQuerySet(models.QuerySet):
+    """Позиции корзины"""
+
+    def totals(self):
+        """Количество и стоимость позиций (по цене со скидкой) одним запросом"""
+        totals = self.aggregate(
+            total_quantity=Sum('quantity'),
+            total_price=Sum(
+                F('quantity') * F('product__effective_price'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+        return {
+            'quantity': totals['total_quantity'] or 0,
+            'total': (totals['total_price'] or Decimal('0')).quantize(Decimal('0.01')),
+        }
+
+
 class CartItem(models.Model):
     """Товары в корзине"""
     cart = models.ForeignKey(
@@ -252,6 +441,8 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField('Количество', default=1)
     added_at = models.DateTimeField('Дата добавления', auto_now_add=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Товар в корзине'
         verbose_name_plural = 'Товары в корзине'
@@ -265,6 +456,45 @@ class CartItem(models.Model):
         return self.product.get_final_price() * self.quantity
 
 
+class StockReservation(models.Model):
+    """Временный резерв товара для корзины или оформления заказа"""
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='stock_reservations'
+    )
+    product = models.ForeignKey(
+        Product,
+        verbose_name='Товар',
+        on_delete=models.CASCADE,
+        related_name='reservations'
+    )
+    quantity = models.PositiveIntegerField('Количество')
+    expires_at = models.DateTimeField('Действует до', db_index=True)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Резерв товара'
+        verbose_name_plural = 'Резервы товаров'
+        unique_together = ['user', 'product']
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} до {self.expires_at:%H:%M}"
+
+
+class OrderNumberBlock(models.Model):
+    """Выделенный блок номеров заказов (id - старшая часть номера, см. order_numbers.py)"""
+    allocated_at = models.DateTimeField('Дата выделения', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Блок номеров заказов'
+        verbose_name_plural = 'Блоки номеров заказов'
+
+    def __str__(self):
+        return f"Блок {self.pk}"
+
+
 class Order(models.Model):
     """Заказы"""
     STATUS_CHOICES = [
@@ -374,10 +604,10 @@ class Order(models.Model):
         return f"Заказ #{self.order_number}"
 
     def generate_order_number(self):
-        """Генерация номера заказа"""
+        """Генерация номера заказа (уникален без проверки и повторов)"""
         if not self.order_number:
-            date_str = timezone.now().strftime('%Y%m%d')
-            self.order_number = f"ORD-{date_str}-{uuid.uuid4().hex[:6].upper()}"
+            from .order_numbers import next_order_number
+            self.order_number = next_order_number()
 
     def save(self, *args, **kwargs):
         if not self.order_number:
@@ -562,4 +792,127 @@ class Address(models.Model):
         if self.is_default:
             Address.objects.filter(user=self.user, is_default=True).update(is_default=False)
 
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class SearchDocument(models.Model):
+    """Документ поискового индекса (один на товар)"""
+    product = models.OneToOneField(
+        Product,
+        verbose_name='Товар',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document'
+    )
+    length = models.PositiveIntegerField('Длина документа', default=0)
+
+    class Meta:
+        verbose_name = 'Поисковый документ'
+        verbose_name_plural = 'Поисковые документы'
+
+    def __str__(self):
+        return f"Документ {self.product_id}"
+
+
+class SearchPosting(models.Model):
+    """Вхождение термина в товар (инвертированный индекс)"""
+    term = models.CharField('Термин', max_length=64)
+    product = models.ForeignKey(
+        Product,
+        verbose_name='Товар',
+        on_delete=models.CASCADE,
+        related_name='search_postings'
+    )
+    tf = models.PositiveIntegerField('Взвешенная частота', default=1)
+
+    class Meta:
+        verbose_name = 'Вхождение термина'
+        verbose_name_plural = 'Поисковый индекс'
+        unique_together = ['term', 'product']
+
+    def __str__(self):
+        return f"{self.term} -> {self.product_id}"
+
+
+class ProductRecommendation(models.Model):
+    """Товары, которые часто покупают вместе (строится командой build_recommendations)"""
+    product = models.ForeignKey(
+        Product,
+        verbose_name='Товар',
+        on_delete=models.CASCADE,
+        related_name='recommendations'
+    )
+    recommended = models.ForeignKey(
+        Product,
+        verbose_name='Рекомендуемый товар',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    rank = models.PositiveSmallIntegerField('Позиция')
+    score = models.FloatField('Оценка')
+
+    class Meta:
+        verbose_name = 'Рекомендация'
+        verbose_name_plural = 'Рекомендации'
+        ordering = ['product', 'rank']
+        unique_together = ['product', 'rank']
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id}"
+
+
+class IdempotencyKey(models.Model):
+    """Ответ на запрос с ключом идемпотентности (повтор запроса получает его же)"""
+    key = models.CharField('Ключ', max_length=64, primary_key=True)
+    # Пусто, пока первый запрос выполняется
+    status_code = models.PositiveSmallIntegerField('Код ответа', null=True)
+    content_type = models.CharField('Тип содержимого', max_length=100, blank=True)
+    location = models.CharField('Адрес перенаправления', max_length=500, blank=True)
+    body = models.BinaryField('Тело ответа', default=b'')
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+
+    def __str__(self):
+        return self.key
+
+
+class Job(models.Model):
+    """Фоновое задание (очередь в базе, см. jobs.py)"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_DEAD = 'dead'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Выполнено'),
+        (STATUS_DEAD, 'Не выполнено'),
+    ]
+
+    name = models.CharField('Задание', max_length=100)
+    payload = models.JSONField('Параметры', default=dict, blank=True)
+    status = models.CharField('Статус', max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    priority = models.SmallIntegerField('Приоритет', default=0)
+    run_at = models.DateTimeField('Запустить не раньше', default=timezone.now)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField('Максимум попыток', default=5)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    locked_by = models.CharField('Обработчик', max_length=100, blank=True)
+    locked_at = models.DateTimeField('Взято в работу', blank=True, null=True)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    finished_at = models.DateTimeField('Дата завершения', blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Фоновое задание'
+        verbose_name_plural = 'Фоновые задания'
+        ordering = ['-created_at']
+        indexes = [
+            # Выборка следующего задания: status = pending ORDER BY priority DESC, run_at
+            models.Index(fields=['status', 'priority', 'run_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
@@ -0,0 +1,128 @@
+# sportshop/order_numbers.py
+"""
+Номера заказов из последовательности, выделяемой блоками (hi/lo).
+
+Процесс получает блок из ORDER_NUMBER_BLOCK_SIZE номеров одной вставкой
+строки OrderNumberBlock, ее id (hi) выдает AUTO_INCREMENT / sequence базы.
+Номера блока (hi * размер + lo) раздаются из памяти процесса без запросов,
+поэтому номера не пересекаются между процессами, не требуют проверки
+уникальности с повтором и не добавляют записей к сохранению заказа.
+
+Блок выделяется вне транзакции вызывающего кода - в отдельном потоке со
+своим соединением в режиме autocommit, и строка блока зафиксирована до
+выдачи первого номера. Иначе откат транзакции заказа откатил бы и строку
+блока, и тот же id мог бы достаться другому процессу (SQLite откатывает
+sqlite_sequence, MySQL до 8.0 пересчитывает AUTO_INCREMENT при
+перезапуске). SQLite не допускает второго пишущего соединения при открытой
+транзакции, поэтому там блок вставляется в текущей транзакции и
+используется, только пока его строка существует: после отката блок
+отбрасывается.
+
+Формат: ORD-ГГММДД-NNNNNNN. Внутри процесса номера возрастают, номера
+разных процессов перемежаются в пределах своих блоков; неиспользованный
+остаток блока при перезапуске процесса пропускается.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+
+ORDER_NUMBER_BLOCK_SIZE = getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', 100)
+
+
+class HiLoSequence:
+    """Последовательность чисел, выделяемых блоками через вставку строки block_model"""
+
+    def __init__(self, block_model, block_size=ORDER_NUMBER_BLOCK_SIZE):
+        self.block_model = block_model
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = self._limit = 0
+        self._hi = None
+        self._committed = True
+
+    def _insert_block(self, using):
+        return self.block_model.objects.using(using).create().pk
+
+    def _insert_block_autocommit(self, using):
+        """Вставка в отдельном потоке: у потока свое соединение вне транзакции вызывающего"""
+        result = {}
+
+        def insert():
+            try:
+                result['hi'] = self._insert_block(using)
+            except Exception as e:
+                result['error'] = e
+            finally:
+                connections[using].close()
+
+        thread = threading.Thread(target=insert)
+        thread.start()
+        thread.join()
+        if 'error' in result:
+            raise result['error']
+        return result['hi']
+
+    def _confirm(self, hi):
+        if self._hi == hi:
+            self._committed = True
+
+    def _allocate(self):
+        using = router.db_for_write(self.block_model)
+        connection = connections[using]
+        if not connection.in_atomic_block:
+            hi = self._insert_block(using)
+            self._committed = True
+        elif connection.vendor != 'sqlite':
+            hi = self._insert_block_autocommit(using)
+            self._committed = True
+        else:
+            hi = self._insert_block(using)
+            self._committed = False
+            transaction.on_commit(lambda: self._confirm(hi), using=using)
+        self._hi = hi
+        self._next = hi * self.block_size
+        self._limit = self._next + self.block_size
+
+    def _block_rolled_back(self):
+        """Блок вставлен в транзакции, которая еще не зафиксирована или откатилась"""
+        if self._committed:
+            return False
+        if self.block_model.objects.using(router.db_for_write(self.block_model)).filter(pk=self._hi).exists():
+            # Та же транзакция еще открыта
+            return False
+        self._committed = True
+        return True
+
+    def next_value(self):
+        with self._lock:
+            # Процесс, порожденный fork, не должен продолжать блок родителя
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._next = self._limit = 0
+            if self._next >= self._limit or self._block_rolled_back():
+                self._allocate()
+            value = self._next
+            self._next += 1
+            return value
+
+
+def format_order_number(value, date=None):
+    date = date or timezone.localdate()
+    return f"ORD-{date:%y%m%d}-{value:07d}"
+
+
+_sequence = None
+
+
+def next_order_number():
+    """Новый номер заказа (без запросов к базе, кроме выделения блока)"""
+    global _sequence
+    if _sequence is None:
+        from .models import OrderNumberBlock
+        _sequence = HiLoSequence(OrderNumberBlock)
+    return format_order_number(_sequence.next_value())
@@ -0,0 +1,202 @@
+# sportshop/pagination.py
+"""
+Курсорная (keyset) пагинация.
+
+Вместо OFFSET и отдельного COUNT(*) следующая страница выбирается условием
+по значениям ключа сортировки последней записи текущей страницы
+(WHERE (price, id) > (...) ORDER BY price, id LIMIT n+1), поэтому глубокие
+страницы обходятся так же дешево, как первая.
+Курсор передается в строке запроса в непрозрачном виде (base64 от JSON).
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+
+CURSOR_PARAM = 'cursor'
+
+FORWARD = 'n'
+BACKWARD = 'p'
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(direction, values):
+    """Упаковать направление и значения ключа в строку для URL"""
+    raw = json.dumps([direction, [_encode_value(value) for value in values]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Распаковать курсор. Для поврежденного курсора возвращает (None, None)"""
+    if not cursor:
+        return None, None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        return None, None
+    if direction not in (FORWARD, BACKWARD) or not isinstance(values, list) or len(values) != size:
+        return None, None
+    return direction, values
+
+
+class KeysetPage:
+    """Страница выборки. Совместима с шаблонами: итерация, len, has_next/has_previous"""
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor, query_params):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self._query_params = query_params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def _query_with_cursor(self, cursor):
+        params = self._query_params.copy()
+        params.pop('page', None)
+        params.pop('format', None)
+        params[CURSOR_PARAM] = cursor
+        return params.urlencode()
+
+    @property
+    def next_query(self):
+        """Строка запроса для ссылки "Вперед" (остальные параметры сохраняются)"""
+        return self._query_with_cursor(self.next_cursor) if self._has_next else ''
+
+    @property
+    def previous_query(self):
+        """Строка запроса для ссылки "Назад" """
+        return self._query_with_cursor(self.previous_cursor) if self._has_previous else ''
+
+
+class KeysetPaginator:
+    """
+    Пагинатор по ключу сортировки.
+
+    ordering - поля сортировки, последнее должно быть уникальным (обычно id),
+    например ('-created_at', 'id') или ('price', 'id').
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [
+            (field.lstrip('-'), field.startswith('-'))
+            for field in self.ordering
+        ]
+
+    def _reversed_ordering(self):
+        return [
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        ]
+
+    def _after(self, values, backward):
+        """Условие "строго после курсора" в направлении обхода"""
+        condition = Q()
+        equal = {}
+        for (field, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending != backward else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def _parse(self, values):
+        """Значения курсора в типах полей сортировки. None, если курсор подделан"""
+        parsed = []
+        for (field, _), value in zip(self.fields, values):
+            if isinstance(value, (list, dict)):
+                return None
+            try:
+                model_field = self.queryset.model._meta.get_field(field)
+            except FieldDoesNotExist:
+                # Аннотация: значение передается как есть
+                parsed.append(value)
+                continue
+            try:
+                parsed.append(model_field.to_python(value))
+            except (ValidationError, TypeError, ValueError):
+                return None
+        return parsed
+
+    def _key(self, obj):
+        return [getattr(obj, field) for field, _ in self.fields]
+
+    def get_page(self, request):
+        direction, values = decode_cursor(request.GET.get(CURSOR_PARAM), len(self.fields))
+        if values is not None:
+            values = self._parse(values)
+            # Поврежденный курсор - первая страница
+            if values is None:
+                direction = None
+        backward = direction == BACKWARD
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._after(values, backward))
+        if backward:
+            queryset = queryset.order_by(*self._reversed_ordering())
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backward:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        next_cursor = encode_cursor(FORWARD, self._key(rows[-1])) if has_next and rows else None
+        previous_cursor = encode_cursor(BACKWARD, self._key(rows[0])) if has_previous and rows else None
+
+        return KeysetPage(
+            rows,
+            has_next=has_next and next_cursor is not None,
+            has_previous=has_previous and previous_cursor is not None,
+            next_cursor=next_cursor,
+            previous_cursor=previous_cursor,
+            query_params=request.GET,
+        )
+
+
+class CountedPaginator(Paginator):
+    """Обычный Paginator с заранее посчитанным количеством (без повторного COUNT)"""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count = count
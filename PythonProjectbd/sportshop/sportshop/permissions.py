@@ -131,6 +131,22 @@ def customer_required(view_func):
     return _wrapped_view
 
 
+def customer_or_anonymous(view_func):
+    """
+    Покупатель или анонимный посетитель (корзина анонимного посетителя
+    хранится в сессии, см. shopping_cart.py)
+    """
+    customer_view = customer_required(view_func)
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+        return customer_view(request, *args, **kwargs)
+
+    return _wrapped_view
+
+
 def manager_required(view_func):
     """
     Требует, чтобы пользователь был менеджером или администратором
@@ -0,0 +1,164 @@
+# sportshop/product_cache.py
+"""
+Кеш товаров по id (read-through) поверх кеша Django.
+
+Бэкенд выбирается настройкой PRODUCT_CACHE_ALIAS (по умолчанию - кеш
+'default', локальная память процесса). Товар хранится вместе с категорией и
+брендом под ключом product:<поколение>:<id>:<версия>.
+
+Версия товара увеличивается при его изменении и удалении, поколение - при
+изменении категорий и брендов. Версия читается ДО загрузки из базы, поэтому
+запрос, прочитавший старые данные, запишет их под уже мертвым ключом и не
+вернет устаревший товар в кеш.
+
+Изменение внутри транзакции увеличивает версию дважды: сразу и после
+фиксации (transaction.on_commit). Запрос, успевший между ними прочитать
+новую версию и еще не зафиксированную (старую) строку, запишет ее под
+ключом, который умрет при фиксации.
+
+Счетчики попаданий и промахов - в памяти процесса (stats()).
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import Http404
+
+from .models import Product
+
+
+PRODUCT_CACHE_ALIAS = getattr(settings, 'PRODUCT_CACHE_ALIAS', 'default')
+PRODUCT_CACHE_TIMEOUT = getattr(settings, 'PRODUCT_CACHE_TIMEOUT', 300)
+
+GENERATION_KEY = 'product:generation'
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[PRODUCT_CACHE_ALIAS]
+
+
+def _version_key(product_id):
+    return f'product:version:{product_id}'
+
+
+def _new_version():
+    # Версия, созданная заново после вытеснения ключа, не совпадет со старой
+    return time.time_ns()
+
+
+def _versions(keys):
+    """Текущие версии для ключей (отсутствующие создаются)"""
+    cache = _cache()
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_version(), None)
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def _bump_now(keys):
+    cache = _cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+
+
+def _bump(keys):
+    keys = list(keys)
+    _bump_now(keys)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump_now(keys))
+
+
+def _count(hits, misses):
+    with _stats_lock:
+        _stats['hits'] += hits
+        _stats['misses'] += misses
+
+
+# ==================== ЧТЕНИЕ ====================
+def get_products(product_ids):
+    """Товары по списку id: {id: товар} (несуществующие id пропускаются)"""
+    try:
+        product_ids = list(dict.fromkeys(int(pk) for pk in product_ids))
+    except (TypeError, ValueError):
+        return {}
+    if not product_ids:
+        return {}
+
+    cache = _cache()
+    version_keys = {_version_key(pk): pk for pk in product_ids}
+    versions = _versions([GENERATION_KEY, *version_keys])
+    generation = versions[GENERATION_KEY]
+
+    entry_keys = {
+        f'product:{generation}:{pk}:{versions[key]}': pk
+        for key, pk in version_keys.items()
+    }
+    cached = cache.get_many(entry_keys)
+    products = {entry_keys[key]: product for key, product in cached.items()}
+
+    missing = [pk for pk in product_ids if pk not in products]
+    _count(len(products), len(missing))
+    if missing:
+        loaded = Product.objects.select_related('category', 'brand').in_bulk(missing)
+        cache.set_many(
+            {key: loaded[pk] for key, pk in entry_keys.items() if pk in loaded},
+            PRODUCT_CACHE_TIMEOUT
+        )
+        products.update(loaded)
+    return products
+
+
+def get_product(product_id):
+    """Товар по id или None"""
+    try:
+        product_id = int(product_id)
+    except (TypeError, ValueError):
+        return None
+    return get_products([product_id]).get(product_id)
+
+
+def get_product_or_404(product_id, **filters):
+    """Товар по id; Http404, если его нет или не совпали значения полей filters"""
+    product = get_product(product_id)
+    if product is None or any(getattr(product, name) != value for name, value in filters.items()):
+        raise Http404('Товар не найден')
+    return product
+
+
+# ==================== СБРОС ====================
+def invalidate(product_id):
+    """Сбросить товар во всех процессах"""
+    _bump([_version_key(product_id)])
+
+
+def invalidate_many(product_ids):
+    _bump([_version_key(pk) for pk in product_ids])
+
+
+def invalidate_all():
+    """Сбросить все товары (изменились категории или бренды)"""
+    _bump([GENERATION_KEY])
+
+
+# ==================== СТАТИСТИКА ====================
+def stats():
+    """Попадания и промахи кеша в текущем процессе"""
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits * 100 / total, 1) if total else 0,
+    }
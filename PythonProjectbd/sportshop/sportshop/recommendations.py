@@ -0,0 +1,123 @@
+# sportshop/recommendations.py
+"""
+Рекомендации "часто покупают вместе".
+
+Матрица совместных покупок товар x товар строится из OrderItem пачками
+заказов: для каждой пачки собирается разреженная матрица заказ x товар B и
+накапливается произведение B.T @ B. Пачка - отдельный запрос по диапазону
+order_id (курсор по id заказа, без OFFSET и без потокового чтения, которое
+драйвер MySQL не поддерживает), поэтому память ограничена размером пачки и
+числом пар товаров.
+Для каждого товара сохраняются TOP_K соседей по косинусной мере.
+"""
+import numpy as np
+from scipy import sparse
+
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Order, OrderItem, Product, ProductRecommendation
+
+
+TOP_K = 8
+ORDERS_PER_CHUNK = 50000
+
+
+def _chunk_matrix(rows, cols, n_orders, n_products):
+    """Бинарная матрица заказ x товар для пачки заказов"""
+    data = np.ones(len(rows), dtype=np.float32)
+    matrix = sparse.csr_matrix(
+        (data, (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))),
+        shape=(n_orders, n_products)
+    )
+    # Один товар несколькими строками в заказе считается один раз
+    matrix.data[:] = 1
+    return matrix
+
+
+def co_purchase_matrix(orders_per_chunk=ORDERS_PER_CHUNK):
+    """Разреженная матрица совместных покупок (на диагонали - число заказов товара)"""
+    n_products = (Product.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+    result = sparse.csr_matrix((n_products, n_products), dtype=np.float32)
+
+    last_order = 0
+    while True:
+        # Id заказов пачки по первичному ключу (без OFFSET), последний - граница пачки
+        order_ids = list(
+            Order.objects.filter(pk__gt=last_order).order_by('pk')
+            .values_list('pk', flat=True)[:orders_per_chunk]
+        )
+        full = len(order_ids) == orders_per_chunk
+        lines = OrderItem.objects.filter(order_id__gt=last_order)
+        if full:
+            lines = lines.filter(order_id__lte=order_ids[-1])
+        lines = list(lines.values_list('order_id', 'product_id'))
+
+        if lines:
+            order_ids, product_ids = zip(*lines)
+            # Номер строки матрицы - порядковый номер заказа в пачке
+            _, rows = np.unique(order_ids, return_inverse=True)
+            chunk = _chunk_matrix(rows, product_ids, rows.max() + 1, n_products)
+            result = result + chunk.T @ chunk
+
+        if not full:
+            break
+        last_order = order_ids[-1]
+
+    return result.tocsr()
+
+
+def top_neighbours(matrix, top_k=TOP_K, min_support=1):
+    """
+    Лучшие соседи для каждого товара: (товар, сосед, позиция, оценка).
+    Оценка - косинусная мера: совместные покупки / sqrt(покупки A * покупки B).
+    """
+    frequency = matrix.diagonal()
+    matrix = (matrix - sparse.diags(frequency, format='csr')).tocsr()
+    matrix.eliminate_zeros()
+
+    for product_id in range(matrix.shape[0]):
+        start, end = matrix.indptr[product_id], matrix.indptr[product_id + 1]
+        if start == end:
+            continue
+
+        neighbours = matrix.indices[start:end]
+        counts = matrix.data[start:end]
+        mask = counts >= min_support
+        neighbours, counts = neighbours[mask], counts[mask]
+        if not len(neighbours):
+            continue
+
+        scores = counts / np.sqrt(frequency[product_id] * frequency[neighbours])
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            neighbours, scores = neighbours[best], scores[best]
+        order = np.lexsort((neighbours, -scores))
+
+        for rank, position in enumerate(order, start=1):
+            yield product_id, int(neighbours[position]), rank, float(scores[position])
+
+
+def build_recommendations(top_k=TOP_K, min_support=1, orders_per_chunk=ORDERS_PER_CHUNK, batch_size=1000):
+    """Перестроить таблицу рекомендаций. Возвращает количество товаров с рекомендациями"""
+    matrix = co_purchase_matrix(orders_per_chunk)
+
+    products = set()
+    with transaction.atomic():
+        ProductRecommendation.objects.all().delete()
+        batch = []
+        for product_id, recommended_id, rank, score in top_neighbours(matrix, top_k, min_support):
+            batch.append(ProductRecommendation(
+                product_id=product_id,
+                recommended_id=recommended_id,
+                rank=rank,
+                score=score,
+            ))
+            products.add(product_id)
+            if len(batch) >= batch_size:
+                ProductRecommendation.objects.bulk_create(batch)
+                batch = []
+        ProductRecommendation.objects.bulk_create(batch)
+
+    return len(products)
+
@@ -0,0 +1,221 @@
+# sportshop/reservations.py
+"""
+Временные резервы товаров (корзина и оформление заказа).
+
+Резерв пользователя по товару - строка StockReservation со сроком действия,
+сумма резервов хранится в счетчике Product.reserved_quantity. Доступный
+остаток = stock_quantity - reserved_quantity. Счетчик увеличивается одним
+условным UPDATE (... WHERE stock_quantity >= reserved_quantity + n), поэтому
+одновременные покупатели не могут зарезервировать больше остатка, а проверки
+доступности не блокируют строки товаров.
+
+Просроченные резервы освобождаются пачками (sweep_expired, команда
+release_expired_reservations), а также при нехватке остатка конкретного
+товара. При оформлении заказа резерв превращается в списание со склада
+(consume): товары блокируются SELECT ... FOR UPDATE в порядке id и
+списываются одним UPDATE. Полное сохранение товара (админка) записывает
+загруженное ранее значение счетчика, поэтому после него счетчик
+пересчитывается по строкам резервов (resync_reserved). Распроданные товары в той же транзакции
+убираются из счетчиков категорий, после фиксации сбрасываются фрагменты
+главной страницы и фасеты.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, PositiveIntegerField, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import counting, facets, fragments
+from .models import Product, StockReservation
+
+
+STOCK_RESERVATION_TTL = getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60)
+# Количество резервов, освобождаемых одной транзакцией
+SWEEP_BATCH_SIZE = 1000
+
+
+class InsufficientStock(Exception):
+    """Доступного остатка товара не хватает"""
+
+    def __init__(self, product_id):
+        self.product_id = product_id
+        super().__init__('Недостаточно товара на складе')
+
+
+def _expires_at():
+    return timezone.now() + timedelta(seconds=STOCK_RESERVATION_TTL)
+
+
+def _hold(product_id, quantity):
+    """Увеличить резерв товара, если хватает остатка. True при успехе"""
+    return bool(
+        Product.objects.filter(pk=product_id, stock_quantity__gte=F('reserved_quantity') + quantity)
+        .update(reserved_quantity=F('reserved_quantity') + quantity)
+    )
+
+
+def _unhold(quantities):
+    """Уменьшить резервы {id товара: n} одним UPDATE (строки блокируются в порядке id)"""
+    product_ids = sorted(product_id for product_id, quantity in quantities.items() if quantity > 0)
+    if not product_ids:
+        return
+    # Без отрицательных промежуточных значений (беззнаковый столбец в MySQL)
+    Product.objects.filter(pk__in=product_ids).update(reserved_quantity=Case(
+        *[When(pk=product_id, reserved_quantity__gte=quantities[product_id],
+               then=F('reserved_quantity') - quantities[product_id])
+          for product_id in product_ids],
+        default=Value(0),
+        output_field=PositiveIntegerField(),
+    ))
+
+
+def resync_reserved(product_ids):
+    """Счетчики резерва товаров = сумма их резервов (одним UPDATE)"""
+    held = (
+        StockReservation.objects.filter(product=OuterRef('pk')).order_by()
+        .values('product').annotate(total=Sum('quantity')).values('total')
+    )
+    Product.objects.filter(pk__in=sorted(product_ids)).update(
+        reserved_quantity=Coalesce(Subquery(held), Value(0), output_field=PositiveIntegerField())
+    )
+
+
+# ==================== РЕЗЕРВИРОВАНИЕ ====================
+def reserve(user, product_id, quantity):
+    """
+    Установить резерв пользователя по товару равным quantity (0 - снять) и
+    продлить его срок. InsufficientStock, если доступного остатка не хватает.
+    """
+    with transaction.atomic():
+        hold = StockReservation.objects.select_for_update().filter(user=user, product_id=product_id).first()
+        # Просроченный, но еще не освобожденный резерв по-прежнему учтен в счетчике
+        delta = quantity - (hold.quantity if hold else 0)
+
+        if delta > 0 and not _hold(product_id, delta):
+            # Возможно, остаток занят просроченными резервами
+            sweep_expired(product_ids=[product_id])
+            if not _hold(product_id, delta):
+                raise InsufficientStock(product_id)
+        elif delta < 0:
+            _unhold({product_id: -delta})
+
+        if quantity <= 0:
+            if hold:
+                hold.delete()
+        elif hold:
+            hold.quantity = quantity
+            hold.expires_at = _expires_at()
+            hold.save(update_fields=['quantity', 'expires_at'])
+        else:
+            StockReservation.objects.create(
+                user=user, product_id=product_id, quantity=quantity, expires_at=_expires_at()
+            )
+
+
+def reserve_many(user, quantities):
+    """Резервы по нескольким товарам {id товара: количество} (все или ничего)"""
+    with transaction.atomic():
+        for product_id in sorted(quantities):
+            reserve(user, product_id, quantities[product_id])
+
+
+def release(user, product_ids=None):
+    """Снять резервы пользователя (все или по списку товаров)"""
+    with transaction.atomic():
+        holds = StockReservation.objects.select_for_update().filter(user=user)
+        if product_ids is not None:
+            holds = holds.filter(product_id__in=product_ids)
+        holds = list(holds.values_list('id', 'product_id', 'quantity'))
+        if holds:
+            StockReservation.objects.filter(id__in=[hold_id for hold_id, _, _ in holds]).delete()
+            _unhold({product_id: quantity for _, product_id, quantity in holds})
+
+
+def consume(user, quantities):
+    """
+    Списать товары заказа {id товара: количество} со склада с учетом резервов
+    пользователя. Возвращает заблокированные товары {id: товар} (цены для
+    заказа берутся из них). InsufficientStock, если остатка не хватает
+    (ничего не списывается). Число запросов не зависит от размера заказа.
+    """
+    if not quantities:
+        return {}
+    with transaction.atomic():
+        # Порядок блокировок как в reserve и sweep_expired: резервы, затем
+        # товары по возрастанию id - параллельные транзакции не ждут друг друга по кругу
+        holds = dict(
+            StockReservation.objects.select_for_update()
+            .filter(user=user, product_id__in=quantities)
+            .values_list('product_id', 'quantity')
+        )
+        products = {
+            product.pk: product
+            for product in Product.objects.select_for_update().filter(pk__in=quantities).order_by('pk')
+        }
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            # Резервы других покупателей (reserved_quantity - свой резерв) не затрагиваются
+            if product is None or product.stock_quantity - product.reserved_quantity + holds.get(product_id, 0) < quantity:
+                raise InsufficientStock(product_id)
+
+        # Одно UPDATE для всех товаров; условие по остатку - страховка поверх блокировки
+        in_stock = Q()
+        stock_whens, reserved_whens, sold_out = [], [], []
+        for product_id, quantity in quantities.items():
+            in_stock |= Q(pk=product_id, stock_quantity__gte=quantity)
+            stock_whens.append(When(pk=product_id, then=F('stock_quantity') - quantity))
+            held = holds.get(product_id, 0)
+            if held:
+                reserved = max(products[product_id].reserved_quantity - held, 0)
+                reserved_whens.append(When(pk=product_id, then=Value(reserved, output_field=PositiveIntegerField())))
+            if products[product_id].stock_quantity <= quantity:
+                sold_out.append(product_id)
+        updates = {
+            'stock_quantity': Case(*stock_whens, default=F('stock_quantity'), output_field=PositiveIntegerField()),
+            'in_stock': Case(When(pk__in=sold_out, then=Value(False)), default=Value(True)),
+        }
+        if reserved_whens:
+            updates['reserved_quantity'] = Case(*reserved_whens, default=F('reserved_quantity'))
+        if Product.objects.filter(in_stock).update(**updates) != len(quantities):
+            raise InsufficientStock(None)
+
+        if sold_out:
+            # UPDATE не вызывает сигналов сохранения товаров
+            counting.products_sold_out(products[product_id] for product_id in sold_out)
+            transaction.on_commit(fragments.invalidate_home)
+            transaction.on_commit(facets.invalidate)
+
+        if holds:
+            StockReservation.objects.filter(user=user, product_id__in=holds).delete()
+    return products
+
+
+# ==================== ОСВОБОЖДЕНИЕ ПРОСРОЧЕННЫХ ====================
+def sweep_expired(product_ids=None, batch_size=SWEEP_BATCH_SIZE):
+    """Освободить просроченные резервы. Возвращает количество снятых резервов"""
+    now = timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            expired = StockReservation.objects.filter(expires_at__lte=now)
+            if product_ids is not None:
+                expired = expired.filter(product_id__in=product_ids)
+            # Резервы, заблокированные продлением в другой транзакции, пропускаются
+            holds = list(
+                expired.select_for_update(skip_locked=True).order_by('id')
+                .values_list('id', 'product_id', 'quantity')[:batch_size]
+            )
+            if not holds:
+                break
+            StockReservation.objects.filter(id__in=[hold_id for hold_id, _, _ in holds]).delete()
+            quantities = defaultdict(int)
+            for _, product_id, quantity in holds:
+                quantities[product_id] += quantity
+            _unhold(quantities)
+        released += len(holds)
+        if len(holds) < batch_size:
+            break
+    return released
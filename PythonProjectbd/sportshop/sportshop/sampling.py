@@ -0,0 +1,70 @@
+# sportshop/sampling.py
+"""
+Случайные выборки товаров без ORDER BY RAND().
+
+Пул id подходящих записей хранится в кеше и обновляется раз в
+SAMPLE_POOL_REFRESH секунд. Каждый запрос выбирает k случайных id из пула
+и загружает их одним запросом через in_bulk (с повторной проверкой фильтра,
+чтобы не показать товар, который перестал подходить после обновления пула).
+"""
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Product
+
+
+SAMPLE_POOL_REFRESH = getattr(settings, 'SAMPLE_POOL_REFRESH', 300)
+SAMPLE_POOL_MAX_SIZE = getattr(settings, 'SAMPLE_POOL_MAX_SIZE', 5000)
+
+
+class SamplePool:
+    """Пул id записей выборки для случайного отбора"""
+
+    def __init__(self, name, queryset, refresh=SAMPLE_POOL_REFRESH, max_size=SAMPLE_POOL_MAX_SIZE):
+        self.name = name
+        self.queryset = queryset
+        self.refresh = refresh
+        self.max_size = max_size
+
+    @property
+    def cache_key(self):
+        return f'sample:{self.name}'
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    def ids(self):
+        """id записей пула (из кеша или из базы)"""
+        ids = cache.get(self.cache_key)
+        if ids is None:
+            ids = list(
+                self.get_queryset().order_by().values_list('pk', flat=True)[:self.max_size]
+            )
+            cache.set(self.cache_key, ids, self.refresh)
+        return ids
+
+    def sample_ids(self, k):
+        """k случайных id из пула"""
+        ids = self.ids()
+        return random.sample(ids, min(k, len(ids)))
+
+    def sample(self, k):
+        """k случайных записей в случайном порядке (один запрос к базе)"""
+        ids = self.sample_ids(k)
+        if not ids:
+            return []
+        objects = self.get_queryset().in_bulk(ids)
+        return [objects[pk] for pk in ids if pk in objects]
+
+    def invalidate(self):
+        """Перестроить пул при следующем обращении"""
+        cache.delete(self.cache_key)
+
+
+# ==================== ПУЛЫ ====================
+discounted_products = SamplePool(
+    'discounted_products',
+    Product.objects.filter(discount_price__isnull=False, in_stock=True, is_active=True),
+)
@@ -0,0 +1,321 @@
+# sportshop/search.py
+"""
+Полнотекстовый поиск по товарам на основе инвертированного индекса.
+
+Индекс хранится в таблицах SearchPosting (термин -> товар) и SearchDocument
+(длина документа), нормализация учитывает русскую морфологию (упрощенный
+стеммер Snowball), ранжирование выполняется по формуле BM25.
+
+Статистика коллекции для BM25 (число документов и их суммарная длина)
+хранится в кеше и изменяется при индексации товаров, поэтому поиск не
+агрегирует всю таблицу документов. Вхождения выбираются только для
+активных товаров в наличии, не более SEARCH_MAX_POSTINGS на термин
+(с наибольшим весом), длина документа читается тем же запросом.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import Product, SearchDocument, SearchPosting
+
+
+# Параметры BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Вес полей документа: совпадение в названии важнее совпадения в описании
+FIELD_WEIGHTS = {
+    'name': 3,
+    'brand': 2,
+    'category': 2,
+    'short_description': 1,
+    'description': 1,
+}
+
+# Кандидатов на термин запроса (частые основы встречаются в тысячах товаров)
+SEARCH_MAX_POSTINGS = getattr(settings, 'SEARCH_MAX_POSTINGS', 1000)
+# Сверка статистики коллекции с таблицей, секунд
+SEARCH_STATS_TIMEOUT = getattr(settings, 'SEARCH_STATS_TIMEOUT', 60 * 60)
+
+STATS_DOCUMENTS_KEY = 'search:stats:documents'
+STATS_LENGTH_KEY = 'search:stats:length'
+
+# Поля товара, изменение которых требует переиндексации
+INDEXED_FIELDS = {'name', 'brand', 'category', 'short_description', 'description', 'is_active'}
+
+TOKEN_RE = re.compile(r'[0-9a-zа-яё]+')
+
+STOP_WORDS = {
+    'и', 'в', 'во', 'не', 'на', 'с', 'со', 'по', 'для', 'из', 'от', 'до', 'за',
+    'к', 'ко', 'о', 'об', 'у', 'а', 'но', 'или', 'же', 'ли', 'бы', 'это', 'как',
+    'the', 'and', 'for', 'of', 'with',
+}
+
+
+# ==================== СТЕММЕР ====================
+_CYRILLIC_RE = re.compile(r'[а-я]')
+_RV_RE = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_PERFECTIVE_GERUND_RE = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE_RE = re.compile(r'(с[яь])$')
+_ADJECTIVE_RE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$'
+)
+_PARTICIPLE_RE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB_RE = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+_NOUN_RE = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+_DERIVATIONAL_RE = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+_SUPERLATIVE_RE = re.compile(r'(ейше|ейш)$')
+
+
+def stem_ru(word):
+    """Упрощенный стеммер Snowball для русского языка"""
+    match = _RV_RE.match(word)
+    if not match:
+        return word
+
+    start, rv = match.groups()
+
+    # Шаг 1: деепричастия, либо возвратные окончания + прилагательные/глаголы/существительные
+    stripped = _PERFECTIVE_GERUND_RE.sub('', rv, 1)
+    if stripped == rv:
+        rv = _REFLEXIVE_RE.sub('', rv, 1)
+        stripped = _ADJECTIVE_RE.sub('', rv, 1)
+        if stripped != rv:
+            rv = _PARTICIPLE_RE.sub('', stripped, 1)
+        else:
+            stripped = _VERB_RE.sub('', rv, 1)
+            rv = _NOUN_RE.sub('', rv, 1) if stripped == rv else stripped
+    else:
+        rv = stripped
+
+    # Шаг 2: окончание "и"
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательные суффиксы
+    if _DERIVATIONAL_RE.match(rv):
+        rv = re.sub(r'ость?$', '', rv)
+
+    # Шаг 4: превосходная степень, двойное "н" и мягкий знак
+    if rv.endswith('ь'):
+        rv = rv[:-1]
+    else:
+        rv = _SUPERLATIVE_RE.sub('', rv, 1)
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+
+    return start + rv
+
+
+def normalize_token(token):
+    """Нормализация одного слова: регистр, ё -> е, стемминг"""
+    token = token.lower().replace('ё', 'е')
+    if _CYRILLIC_RE.search(token):
+        return stem_ru(token)
+    # Латиница: отбрасываем окончание множественного числа
+    if len(token) > 4 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Разбить текст на нормализованные термины (без стоп-слов)"""
+    if not text:
+        return []
+
+    terms = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if len(token) < 2 or token in STOP_WORDS:
+            continue
+        terms.append(normalize_token(token)[:64])
+    return terms
+
+
+# ==================== СТАТИСТИКА КОЛЛЕКЦИИ ====================
+def collection_stats():
+    """Число документов и их суммарная длина: (documents, length)"""
+    stats = cache.get_many([STATS_DOCUMENTS_KEY, STATS_LENGTH_KEY])
+    if len(stats) == 2:
+        return stats[STATS_DOCUMENTS_KEY], stats[STATS_LENGTH_KEY]
+    totals = SearchDocument.objects.aggregate(documents=Count('product_id'), length=Sum('length'))
+    documents, length = totals['documents'] or 0, totals['length'] or 0
+    cache.set_many({STATS_DOCUMENTS_KEY: documents, STATS_LENGTH_KEY: length}, SEARCH_STATS_TIMEOUT)
+    return documents, length
+
+
+def _adjust_stats(documents, length):
+    for key, delta in ((STATS_DOCUMENTS_KEY, documents), (STATS_LENGTH_KEY, length)):
+        if delta:
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                # Статистики нет в кеше - будет посчитана при следующем поиске
+                pass
+
+
+def reset_stats():
+    cache.delete_many([STATS_DOCUMENTS_KEY, STATS_LENGTH_KEY])
+
+
+# ==================== ИНДЕКСАЦИЯ ====================
+def build_document(product):
+    """Взвешенные частоты терминов для товара"""
+    fields = {
+        'name': product.name,
+        'brand': product.brand.name if product.brand_id else '',
+        'category': product.category.name if product.category_id else '',
+        'short_description': product.short_description,
+        'description': product.description,
+    }
+
+    frequencies = Counter()
+    for field, text in fields.items():
+        weight = FIELD_WEIGHTS[field]
+        for term in tokenize(text):
+            frequencies[term] += weight
+    return frequencies
+
+
+def index_product(product):
+    """Переиндексировать товар (вызывается из сигналов при сохранении)"""
+    if not product.is_active:
+        remove_product(product.pk)
+        return
+
+    frequencies = build_document(product)
+    length = sum(frequencies.values())
+
+    with transaction.atomic():
+        previous = SearchDocument.objects.filter(product_id=product.pk).values_list('length', flat=True).first()
+        SearchPosting.objects.filter(product_id=product.pk).delete()
+        SearchPosting.objects.bulk_create([
+            SearchPosting(term=term, product_id=product.pk, tf=tf)
+            for term, tf in frequencies.items()
+        ])
+        if previous is None:
+            SearchDocument.objects.create(product_id=product.pk, length=length)
+        else:
+            SearchDocument.objects.filter(product_id=product.pk).update(length=length)
+        transaction.on_commit(lambda: _adjust_stats(int(previous is None), length - (previous or 0)))
+
+
+def remove_product(product_id):
+    """Удалить товар из индекса"""
+    with transaction.atomic():
+        previous = SearchDocument.objects.filter(product_id=product_id).values_list('length', flat=True).first()
+        SearchPosting.objects.filter(product_id=product_id).delete()
+        if previous is not None:
+            SearchDocument.objects.filter(product_id=product_id).delete()
+            transaction.on_commit(lambda: _adjust_stats(-1, -previous))
+
+
+def index_products(product_ids, batch_size=1000):
+    """
+    Переиндексировать товары пачками: удаление и вставка одним запросом на
+    пачку (переименование категории или бренда). Возвращает количество
+    """
+    product_ids = sorted(set(product_ids))
+    indexed = 0
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        products = Product.objects.filter(pk__in=batch, is_active=True).select_related('category', 'brand')
+        postings, documents = [], []
+        for product in products:
+            frequencies = build_document(product)
+            postings.extend(
+                SearchPosting(term=term, product_id=product.pk, tf=tf)
+                for term, tf in frequencies.items()
+            )
+            documents.append(SearchDocument(product_id=product.pk, length=sum(frequencies.values())))
+
+        with transaction.atomic():
+            previous = SearchDocument.objects.filter(product_id__in=batch).aggregate(
+                documents=Count('product_id'), length=Sum('length')
+            )
+            # Неактивные товары пачки удаляются из индекса
+            SearchPosting.objects.filter(product_id__in=batch).delete()
+            SearchDocument.objects.filter(product_id__in=batch).delete()
+            SearchPosting.objects.bulk_create(postings, batch_size=batch_size)
+            SearchDocument.objects.bulk_create(documents)
+            documents_delta = len(documents) - previous['documents']
+            length_delta = sum(document.length for document in documents) - (previous['length'] or 0)
+            transaction.on_commit(lambda: _adjust_stats(documents_delta, length_delta))
+        indexed += len(documents)
+    return indexed
+
+
+def rebuild_index(batch_size=1000):
+    """Полная перестройка индекса. Возвращает количество проиндексированных товаров"""
+    SearchPosting.objects.all().delete()
+    SearchDocument.objects.all().delete()
+
+    products = Product.objects.filter(is_active=True).select_related('category', 'brand')
+    postings, documents, indexed = [], [], 0
+
+    for product in products.iterator(chunk_size=batch_size):
+        frequencies = build_document(product)
+        postings.extend(
+            SearchPosting(term=term, product_id=product.pk, tf=tf)
+            for term, tf in frequencies.items()
+        )
+        documents.append(SearchDocument(product_id=product.pk, length=sum(frequencies.values())))
+        indexed += 1
+
+        if len(documents) >= batch_size:
+            SearchPosting.objects.bulk_create(postings, batch_size=batch_size)
+            SearchDocument.objects.bulk_create(documents, batch_size=batch_size)
+            postings, documents = [], []
+
+    SearchPosting.objects.bulk_create(postings, batch_size=batch_size)
+    SearchDocument.objects.bulk_create(documents, batch_size=batch_size)
+    reset_stats()
+    return indexed
+
+
+# ==================== ПОИСК ====================
+def search_product_ids(query):
+    """
+    Список id активных товаров в наличии, отсортированный по убыванию
+    релевантности (BM25). Товар должен содержать хотя бы один термин запроса.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+
+    total_docs, total_length = collection_stats()
+    if not total_docs:
+        return []
+    avg_length = total_length / total_docs or 1
+
+    # Частота термина - по всему индексу (счет по индексу term, product)
+    doc_freq = dict(
+        SearchPosting.objects.filter(term__in=terms).order_by()
+        .values_list('term').annotate(df=Count('id'))
+    )
+
+    scores = defaultdict(float)
+    for term in terms:
+        df = doc_freq.get(term)
+        if not df:
+            continue
+        idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+        postings = (
+            SearchPosting.objects.filter(term=term, product__is_active=True, product__in_stock=True)
+            .order_by('-tf', 'product_id')
+            .values_list('product_id', 'tf', 'product__search_document__length')[:SEARCH_MAX_POSTINGS]
+        )
+        for product_id, tf, length in postings:
+            length_norm = 1 - BM25_B + BM25_B * (length or avg_length) / avg_length
+            scores[product_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * length_norm)
+
+    return sorted(scores, key=lambda product_id: (-scores[product_id], -product_id))
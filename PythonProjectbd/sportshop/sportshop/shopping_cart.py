@@ -0,0 +1,284 @@
+# sportshop/shopping_cart.py
+"""
+Корзина покупателя с единым интерфейсом для двух хранилищ.
+
+UserCart - постоянная корзина (Cart/CartItem) авторизованного пользователя.
+SessionCart - корзина анонимного посетителя: словарь {id товара: количество}
+в сессии, без строк в базе. Товары для нее берутся из кеша товаров
+(product_cache.py).
+
+Изменения UserCart - одиночные атомарные запросы без чтения строки:
+добавление - INSERT ... ON DUPLICATE KEY UPDATE / ON CONFLICT DO UPDATE
+с quantity = quantity + n (не больше остатка на складе), изменение
+количества - UPDATE с проверкой остатка в том же запросе. Для баз без
+upsert - UPDATE с F() и INSERT с повтором при конфликте.
+
+При входе в систему корзина из сессии переносится в Cart одним массовым
+upsert (merge_session_cart, вызывается сигналом user_logged_in).
+
+Товары в корзине пользователя резервируются на складе на время
+STOCK_RESERVATION_TTL (reservations.py): изменение, для которого не хватает
+доступного остатка, откатывается с InsufficientStock. Анонимная корзина
+резерва не держит - он создается после входа, при оформлении заказа.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Exists, F, OuterRef, Subquery
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from .models import Cart, CartItem, Product
+from . import product_cache, cart_summary, reservations
+
+
+SESSION_CART_KEY = 'cart'
+
+
+# ==================== UPSERT ПОЗИЦИЙ ====================
+def _supports_upsert():
+    if connection.vendor == 'mysql':
+        return True
+    # RETURNING в SQLite - с версии 3.35
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert
+
+
+def _upsert_sql(rows, cap):
+    """INSERT ... ON DUPLICATE KEY UPDATE / ON CONFLICT DO UPDATE для rows позиций"""
+    qn = connection.ops.quote_name
+    table = qn(CartItem._meta.db_table)
+    columns = ', '.join(qn(name) for name in ('cart_id', 'product_id', 'quantity', 'added_at'))
+    values = ', '.join(['(%s, %s, %s, %s)'] * rows)
+    stock = f'(SELECT {qn("stock_quantity")} FROM {qn(Product._meta.db_table)} WHERE {qn("id")} = %s)'
+
+    if connection.vendor == 'mysql':
+        new_quantity = f'{qn("quantity")} + VALUES({qn("quantity")})'
+        if cap:
+            new_quantity = f'LEAST({new_quantity}, {stock})'
+        return (
+            f'INSERT INTO {table} ({columns}) VALUES {values} '
+            f'ON DUPLICATE KEY UPDATE {qn("quantity")} = {new_quantity}'
+        )
+
+    new_quantity = f'{table}.{qn("quantity")} + excluded.{qn("quantity")}'
+    if cap:
+        least = 'MIN' if connection.vendor == 'sqlite' else 'LEAST'
+        new_quantity = f'{least}({new_quantity}, {stock})'
+    return (
+        f'INSERT INTO {table} ({columns}) VALUES {values} '
+        f'ON CONFLICT ({qn("cart_id")}, {qn("product_id")}) '
+        f'DO UPDATE SET {qn("quantity")} = {new_quantity} '
+        f'RETURNING {qn("product_id")}, {qn("quantity")}'
+    )
+
+
+def _add_portable(cart_id, product_id, quantity, cap):
+    """Добавление без upsert: UPDATE с F(), при отсутствии строки - INSERT"""
+    items = CartItem.objects.filter(cart_id=cart_id, product_id=product_id)
+    new_quantity = F('quantity') + quantity
+    if cap:
+        new_quantity = Least(new_quantity, Subquery(
+            Product.objects.filter(pk=product_id).order_by().values('stock_quantity')[:1]
+        ))
+    for attempt in range(2):
+        if items.update(quantity=new_quantity):
+            return
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(cart_id=cart_id, product_id=product_id, quantity=quantity)
+            return
+        except IntegrityError:
+            # Строку вставил параллельный запрос - повторяем UPDATE
+            continue
+
+
+def add_cart_items(cart_id, quantities, cap=True):
+    """
+    Прибавить количества {id товара: n} к позициям корзины одним запросом.
+    cap - не больше остатка на складе (только для одного товара).
+    Возвращает {id товара: новое количество}.
+    """
+    if not quantities:
+        return {}
+    if cap and len(quantities) > 1:
+        raise ValueError('Ограничение остатком поддерживается только для одного товара')
+    product_ids = sorted(quantities)
+
+    if not _supports_upsert():
+        for product_id in product_ids:
+            _add_portable(cart_id, product_id, quantities[product_id], cap)
+        return dict(CartItem.objects.filter(cart_id=cart_id, product_id__in=product_ids)
+                    .values_list('product_id', 'quantity'))
+
+    added_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    params = []
+    for product_id in product_ids:
+        params += [cart_id, product_id, quantities[product_id], added_at]
+    if cap:
+        params.append(product_ids[0])
+
+    with connection.cursor() as cursor:
+        cursor.execute(_upsert_sql(len(product_ids), cap), params)
+        if connection.vendor != 'mysql':
+            return dict(cursor.fetchall())
+    return dict(CartItem.objects.filter(cart_id=cart_id, product_id__in=product_ids)
+                .values_list('product_id', 'quantity'))
+
+
+# ==================== КОРЗИНЫ ====================
+class UserCart:
+    """Корзина авторизованного пользователя (строки CartItem)"""
+
+    def __init__(self, user):
+        self.user = user
+        self._cart = None
+
+    @property
+    def cart(self):
+        if self._cart is None:
+            self._cart, created = Cart.objects.get_or_create(user=self.user)
+        return self._cart
+
+    def _items(self, product):
+        # Подзапрос вместо JOIN: UPDATE остается одним запросом и в MySQL
+        cart_id = Subquery(Cart.objects.filter(user=self.user).values('pk')[:1])
+        return CartItem.objects.filter(cart_id=cart_id, product_id=product.pk)
+
+    def add(self, product, quantity):
+        """
+        Добавить товар (не больше остатка); возвращает новое количество в
+        корзине. InsufficientStock, если товар не удалось зарезервировать.
+        """
+        with transaction.atomic():
+            new_quantity = add_cart_items(self.cart.pk, {product.pk: quantity})[product.pk]
+            reservations.reserve(self.user, product.pk, new_quantity)
+        # Запросы в обход save() не вызывают сигналы CartItem
+        cart_summary.invalidate_cart(self.user.pk)
+        return new_quantity
+
+    def set_quantity(self, product, quantity):
+        """
+        Изменить количество (0 и меньше - удалить). False, если товара нет в
+        корзине или на складе меньше quantity; InsufficientStock, если не
+        удалось зарезервировать.
+        """
+        with transaction.atomic():
+            if quantity <= 0:
+                deleted, _ = self._items(product).delete()
+                changed = bool(deleted)
+            else:
+                in_stock = Product.objects.filter(pk=OuterRef('product_id'), stock_quantity__gte=quantity)
+                changed = bool(self._items(product).filter(Exists(in_stock)).update(quantity=quantity))
+            if changed:
+                reservations.reserve(self.user, product.pk, max(quantity, 0))
+        if changed:
+            cart_summary.invalidate_cart(self.user.pk)
+        return changed
+
+    def remove(self, product):
+        """Удалить товар. False, если его нет в корзине"""
+        return self.set_quantity(product, 0)
+
+    def lines(self):
+        """Позиции корзины для вывода"""
+        return CartItem.objects.filter(cart__user=self.user).select_related('product')
+
+    def clear(self):
+        """Очистить корзину"""
+        # Сигналы CartItem берут владельца корзины из кеша, без запроса на позицию
+        CartItem.objects.filter(cart__user=self.user).delete()
+
+    def totals(self):
+        return CartItem.objects.filter(cart__user=self.user).totals()
+
+
+class SessionCartItem:
+    """Позиция корзины из сессии (атрибуты как у CartItem)"""
+
+    def __init__(self, product, quantity):
+        self.product = product
+        self.quantity = quantity
+
+    def get_total_price(self):
+        return self.product.get_final_price() * self.quantity
+
+
+class SessionCart:
+    """Корзина анонимного посетителя в сессии"""
+
+    def __init__(self, session):
+        self.session = session
+
+    @property
+    def items(self):
+        """{id товара: количество}"""
+        return {int(pk): quantity for pk, quantity in self.session.get(SESSION_CART_KEY, {}).items()}
+
+    def _save(self, items):
+        if items:
+            self.session[SESSION_CART_KEY] = {str(pk): quantity for pk, quantity in items.items()}
+        else:
+            self.session.pop(SESSION_CART_KEY, None)
+
+    def add(self, product, quantity):
+        items = self.items
+        items[product.pk] = min(items.get(product.pk, 0) + quantity, product.stock_quantity)
+        self._save(items)
+        return items[product.pk]
+
+    def set_quantity(self, product, quantity):
+        items = self.items
+        if product.pk not in items or quantity > product.stock_quantity:
+            return False
+        if quantity <= 0:
+            del items[product.pk]
+        else:
+            items[product.pk] = quantity
+        self._save(items)
+        return True
+
+    def remove(self, product):
+        return self.set_quantity(product, 0)
+
+    def clear(self):
+        self._save({})
+
+    def lines(self):
+        """Позиции с товарами из кеша (снятые с продажи пропускаются)"""
+        items = self.items
+        products = product_cache.get_products(items)
+        return [
+            SessionCartItem(products[pk], quantity)
+            for pk, quantity in items.items()
+            if pk in products and products[pk].is_active
+        ]
+
+    def totals(self):
+        lines = self.lines()
+        return {
+            'quantity': sum(line.quantity for line in lines),
+            'total': sum((line.get_total_price() for line in lines), Decimal('0')),
+        }
+
+
+def get_cart(request):
+    """Корзина текущего посетителя"""
+    if request.user.is_authenticated:
+        return UserCart(request.user)
+    return SessionCart(request.session)
+
+
+def merge_session_cart(request, user):
+    """Перенести корзину из сессии в корзину пользователя (количества складываются)"""
+    session_cart = SessionCart(request.session)
+    items = session_cart.items
+    if not items:
+        return
+
+    with transaction.atomic():
+        cart, created = Cart.objects.get_or_create(user=user)
+        product_ids = Product.objects.filter(pk__in=items, is_active=True).values_list('pk', flat=True)
+        # Количества складываются в самом upsert (остаток проверяется при оформлении)
+        add_cart_items(cart.pk, {pk: items[pk] for pk in product_ids}, cap=False)
+
+    session_cart.clear()
@@ -1,9 +1,13 @@
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_migrate, pre_save, post_save, pre_delete, post_delete
+from django.db import transaction
 from django.dispatch import receiver
 from django.contrib.auth.models import Group, Permission
+from django.contrib.auth.signals import user_logged_in
 from django.contrib.contenttypes.models import ContentType
-from .models import Product, Order, Category, User, Review
+from .models import Product, Order, Category, Brand, User, Review, CartItem, SUGGEST_FIELDS
 from .permissions import setup_user_groups
+from . import search, suggest, fragments, counting, facets, product_cache, cards, cart_summary, shopping_cart, catalog_engine
+from . import reservations, jobs
 
 
 @receiver(post_migrate)
@@ -12,4 +16,219 @@ def setup_default_groups(sender, **kwargs):
     Автоматически создает группы и настраивает права после миграций
     """
     if sender.name == 'sportshop':
-        setup_user_groups()
\ No newline at end of file
+        setup_user_groups()
+
+
+# ==================== ПОИСКОВЫЙ ИНДЕКС ====================
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Переиндексация товара при сохранении"""
+    # Изменение только счетчиков (просмотры, рейтинг) не влияет на текст
+    if raw or (update_fields and not set(update_fields) & search.INDEXED_FIELDS):
+        return
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    """Удаление товара из индекса"""
+    search.remove_product(instance.pk)
+
+
+# Переиндексация всех товаров категории или бренда - фоновым заданием, не в запросе админки
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created=False, raw=False, **kwargs):
+    """Название категории входит в документ товара"""
+    if raw or created:
+        return
+    jobs.enqueue('reindex_products', category_id=instance.pk)
+
+
+@receiver(post_save, sender=Brand)
+def reindex_brand_products(sender, instance, created=False, raw=False, **kwargs):
+    """Название бренда входит в документ товара"""
+    if raw or created:
+        return
+    jobs.enqueue('reindex_products', brand_id=instance.pk)
+
+
+@receiver(pre_delete, sender=Brand)
+def remember_brand_products(sender, instance, **kwargs):
+    """Товары удаляемого бренда (после удаления бренд у них обнуляется)"""
+    instance._product_ids = list(instance.products.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Brand)
+def reindex_former_brand_products(sender, instance, **kwargs):
+    """Переиндексация товаров без бренда"""
+    product_ids = getattr(instance, '_product_ids', [])
+    if product_ids:
+        jobs.enqueue('reindex_products', product_ids=product_ids)
+
+
+# ==================== ПОДСКАЗКИ ПОИСКА ====================
+@receiver(post_save, sender=Product)
+def invalidate_suggest_on_save(sender, instance, created=False, update_fields=None, **kwargs):
+    """Сброс индекса подсказок, если изменились выводимые в них поля"""
+    if update_fields and not set(update_fields) & set(SUGGEST_FIELDS):
+        return
+    # Товар, загруженный не полностью, не сравнивается (лишние запросы за отложенными полями)
+    if not instance.get_deferred_fields():
+        state = instance.suggest_state()
+        if not created and getattr(instance, '_suggest_state', None) == state:
+            return
+        instance._suggest_state = state
+    suggest.invalidate()
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def invalidate_suggest(sender, **kwargs):
+    """Сброс индекса подсказок при изменении товаров, категорий и брендов"""
+    suggest.invalidate()
+
+
+# ==================== КЕШ ФРАГМЕНТОВ ====================
+@receiver(post_save, sender=Product)
+def invalidate_home_on_save(sender, instance, update_fields=None, **kwargs):
+    """Сброс фрагментов главной страницы (просмотры на ней не выводятся)"""
+    if update_fields and set(update_fields) <= {'views'}:
+        return
+    fragments.invalidate_home()
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_home(sender, **kwargs):
+    """Сброс фрагментов главной страницы при изменении товаров и категорий"""
+    fragments.invalidate_home()
+
+
+# ==================== СЧЕТЧИКИ КАТЕГОРИЙ ====================
+@receiver(pre_save, sender=Product)
+def remember_counted_category(sender, instance, **kwargs):
+    """Состояние товара до сохранения (если оно не известно после загрузки)"""
+    counting.remember_product_state(instance)
+
+
+@receiver(post_save, sender=Product)
+def update_category_counter(sender, instance, created=False, **kwargs):
+    """Обновление счетчика активных товаров категории"""
+    counting.product_saved(instance, created)
+
+
+@receiver(post_delete, sender=Product)
+def decrement_category_counter(sender, instance, **kwargs):
+    """Уменьшение счетчика при удалении товара"""
+    counting.product_deleted(instance)
+
+
+# ==================== РЕЙТИНГ ТОВАРОВ ====================
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def update_product_rating(sender, instance, raw=False, **kwargs):
+    """Пересчет рейтинга товара при добавлении, изменении, публикации и удалении отзыва"""
+    if raw:
+        return
+    counting.update_product_rating(instance.product_id)
+    # Рейтинг выводится в кешированных секциях главной страницы
+    fragments.invalidate_home()
+
+
+# ==================== ФАСЕТЫ ====================
+@receiver(post_save, sender=Product)
+def invalidate_facets_on_save(sender, instance, update_fields=None, **kwargs):
+    """Сброс битовых карт фасетов (если изменились значения фильтров товара)"""
+    if update_fields and not set(update_fields) & facets.FACET_FIELDS:
+        return
+    if not instance.get_deferred_fields():
+        state = instance.facet_state()
+        if getattr(instance, '_facet_state', None) == state:
+            return
+        instance._facet_state = state
+    facets.invalidate()
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def invalidate_facets(sender, **kwargs):
+    """Сброс битовых карт фасетов при изменении товаров, категорий и брендов"""
+    facets.invalidate()
+
+
+# ==================== КЕШ ТОВАРОВ ====================
+@receiver(post_save, sender=Product)
+def invalidate_cached_product_on_save(sender, instance, update_fields=None, **kwargs):
+    """Сброс товара в кеше (кроме обновления одних просмотров)"""
+    if update_fields and set(update_fields) <= {'views'}:
+        return
+    product_cache.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_cached_product(sender, instance, **kwargs):
+    product_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def invalidate_cached_products(sender, **kwargs):
+    """Категория и бренд хранятся в кеше вместе с товаром"""
+    product_cache.invalidate_all()
+
+
+# ==================== РЕЗЕРВЫ ====================
+@receiver(post_save, sender=Product)
+def resync_reserved_quantity(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    """Сохранение всех полей записало загруженный ранее счетчик резерва - пересчет"""
+    if created or raw or (update_fields and 'reserved_quantity' not in update_fields):
+        return
+    reservations.resync_reserved([instance.pk])
+
+
+# ==================== ДВИЖОК КАТАЛОГА ====================
+@receiver(post_delete, sender=Product)
+def reload_catalog_engine(sender, **kwargs):
+    """Удаленный товар не виден опросу updated_at - перезагрузка столбцов после фиксации"""
+    transaction.on_commit(catalog_engine.product_deleted)
+
+
+# ==================== КАРТОЧКИ ТОВАРОВ ====================
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def invalidate_cards(sender, **kwargs):
+    """Названия категории и бренда выводятся в карточках (изменения товара меняют ключ сами)"""
+    cards.invalidate()
+
+
+# ==================== ИТОГИ КОРЗИНЫ ====================
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def invalidate_cart_summary(sender, instance, raw=False, **kwargs):
+    """Сохраненные в сессиях итоги корзины устаревают при изменении позиций"""
+    if raw:
+        return
+    cart_summary.invalidate_item_cart(instance)
+
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    """Корзина, собранная до входа, переносится в корзину пользователя"""
+    if request is None or not hasattr(request, 'session'):
+        return
+    if request.session.get(shopping_cart.SESSION_CART_KEY):
+        shopping_cart.merge_session_cart(request, user)
+        # Массовая вставка не вызывает сигналы CartItem
+        cart_summary.invalidate_cart(user.pk)
+    cart_summary.reset_cart_summary(request)
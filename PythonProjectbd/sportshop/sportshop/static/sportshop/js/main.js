@@ -17,6 +17,19 @@ const SportShop = {
         });
     },
 
+    // Экранирование текста для вставки в HTML (как автоэкранирование шаблонов)
+    escapeHtml(value) {
+        return String(value ?? '').replace(/[&<>"']/g, char => ({
+            '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#x27;'
+        })[char]);
+    },
+
+    // Обрезка текста как фильтром truncatechars
+    truncateChars(value, length) {
+        const text = String(value ?? '');
+        return text.length > length ? text.slice(0, length - 1) + '…' : text;
+    },
+
     // Получение CSRF токена
     getCSRFToken() {
         return document.querySelector('[name=csrfmiddlewaretoken]')?.value || '';
@@ -160,15 +173,26 @@ class CartManager {
     }
 
     async addToCart(productId, quantity = 1) {
+        // newIdempotencyKey() объявлена в base.html
+        const idempotencyKey = newIdempotencyKey();
+        const send = () => fetch(`/cart/add/${productId}/`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': SportShop.getCSRFToken(),
+                'X-Idempotency-Key': idempotencyKey
+            },
+            body: JSON.stringify({ quantity: quantity })
+        });
+
         try {
-            const response = await fetch(`/cart/add/${productId}/`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-CSRFToken': SportShop.getCSRFToken()
-                },
-                body: JSON.stringify({ quantity: quantity })
-            });
+            let response;
+            try {
+                response = await send();
+            } catch (networkError) {
+                // Повтор после обрыва соединения с тем же ключом не добавит товар дважды
+                response = await send();
+            }
 
             const data = await response.json();
 
@@ -490,11 +514,11 @@ class SearchManager {
 
     async performSearch(query) {
         try {
-            const response = await fetch(`/search/?q=${encodeURIComponent(query)}&format=json`);
+            const response = await fetch(`/api/suggest/?q=${encodeURIComponent(query)}`);
             const data = await response.json();
 
-            if (data.products && data.products.length > 0) {
-                this.showResults(data.products, query);
+            if (data.products.length > 0 || data.brands.length > 0 || data.categories.length > 0) {
+                this.showResults(data, query);
             } else {
                 this.showNoResults(query);
             }
@@ -503,7 +527,7 @@ class SearchManager {
         }
     }
 
-    showResults(products, query) {
+    showResults(data, query) {
         if (!this.searchResults) {
             this.searchResults = document.createElement('div');
             this.searchResults.id = 'search-results';
@@ -519,9 +543,17 @@ class SearchManager {
             <div class="search-results-list">
         `;
 
-        products.slice(0, 5).forEach(product => {
+        [...data.categories, ...data.brands].slice(0, 3).forEach(item => {
+            html += `
+                <a href="${item.url}" class="search-result-item search-result-link">
+                    <div class="search-result-title">${item.name}</div>
+                </a>
+            `;
+        });
+
+        data.products.slice(0, 5).forEach(product => {
             html += `
-                <a href="/product/${product.id}/" class="search-result-item">
+                <a href="${product.url}" class="search-result-item">
                     <div class="search-result-image">
                         ${product.image ? 
                             `<img src="${product.image}" alt="${product.name}">` : 
@@ -568,6 +600,101 @@ class SearchManager {
     }
 }
 
+// Бесконечная прокрутка каталога (курсорная пагинация, JSON)
+class InfiniteScroll {
+    constructor() {
+        this.grid = document.querySelector('[data-infinite-scroll]');
+        this.loading = false;
+
+        if (this.grid && this.grid.dataset.nextUrl && 'IntersectionObserver' in window) {
+            this.initialize();
+        }
+    }
+
+    initialize() {
+        // Ссылки "Назад/Вперед" остаются запасным вариантом без JS
+        document.querySelectorAll('.pagination').forEach(el => el.style.display = 'none');
+
+        this.sentinel = document.createElement('div');
+        this.sentinel.className = 'infinite-scroll-sentinel';
+        this.grid.after(this.sentinel);
+
+        this.observer = new IntersectionObserver((entries) => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                this.loadMore();
+            }
+        }, { rootMargin: '400px' });
+        this.observer.observe(this.sentinel);
+    }
+
+    async loadMore() {
+        const nextUrl = this.grid.dataset.nextUrl;
+        if (this.loading || !nextUrl) return;
+
+        this.loading = true;
+        try {
+            const response = await fetch(nextUrl, { headers: { 'Accept': 'application/json' } });
+            const data = await response.json();
+
+            data.products.forEach(product => {
+                this.grid.insertAdjacentHTML('beforeend', this.renderCard(product));
+                const button = this.grid.lastElementChild.querySelector('.btn-add-to-cart');
+                if (button && typeof addToCart === 'function') {
+                    button.addEventListener('click', () => addToCart(product.id, 1, button));
+                }
+            });
+
+            this.grid.dataset.nextUrl = data.next_url || '';
+            if (!data.next_url) {
+                this.observer.disconnect();
+                this.sentinel.remove();
+            }
+        } catch (error) {
+            console.error('Infinite scroll error:', error);
+        } finally {
+            this.loading = false;
+        }
+    }
+
+    renderCard(product) {
+        const rating = Math.round(product.rating);
+        const stars = '★'.repeat(rating) + '☆'.repeat(5 - rating);
+        // Данные товара экранируются: карточка собирается через innerHTML
+        const escape = SportShop.escapeHtml;
+        const url = escape(product.url);
+        const name = escape(product.name);
+
+        return `
+            <div class="product-card">
+                <a href="${url}" class="product-image">
+                    ${product.image
+                        ? `<img src="${escape(product.image)}" alt="${name}">`
+                        : '<div class="no-image-placeholder"><i class="fas fa-image"></i><span>Нет изображения</span></div>'}
+                    ${product.discount_price ? `<span class="discount-badge">-${escape(product.discount_percentage)}%</span>` : ''}
+                </a>
+                <div class="product-info">
+                    <a href="${url}" class="product-name"><h3>${escape(SportShop.truncateChars(product.name, 40))}</h3></a>
+                    <div class="product-category">${escape(product.category || 'Без категории')}</div>
+                    <div class="product-price">
+                        ${product.discount_price
+                            ? `<span class="price-old">${escape(product.price)} ₽</span><span class="price-new">${escape(product.discount_price)} ₽</span>`
+                            : `<span class="price-current">${escape(product.price)} ₽</span>`}
+                    </div>
+                    <div class="product-rating">
+                        <div class="stars">${stars}</div>
+                        <span class="rating-value">${escape(product.rating)}</span>
+                    </div>
+                    <div class="product-actions">
+                        ${product.in_stock
+                            ? `<button class="btn-add-to-cart" data-product-id="${escape(product.id)}"><i class="fas fa-shopping-cart"></i> В корзину</button>`
+                            : '<button class="btn-out-of-stock" disabled>Нет в наличии</button>'}
+                    </div>
+                </div>
+            </div>
+        `;
+    }
+}
+
 // Оформление заказа
 class CheckoutManager {
     constructor() {
@@ -700,6 +827,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const reviewManager = new ReviewManager();
     const searchManager = new SearchManager();
     const checkoutManager = new CheckoutManager();
+    const infiniteScroll = new InfiniteScroll();
 
     // Плавная прокрутка для якорей
     document.querySelectorAll('a[href^="#"]').forEach(anchor => {
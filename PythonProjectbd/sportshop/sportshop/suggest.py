@@ -0,0 +1,184 @@
+# sportshop/suggest.py
+"""
+Подсказки для строки поиска (автодополнение).
+
+Названия товаров, бренды и категории хранятся в памяти процесса в виде
+отсортированного массива ключей, поиск по префиксу выполняется через bisect.
+Совпадения ранжируются по просмотрам во всем диапазоне префикса; для
+коротких префиксов (до SHORT_PREFIX_LENGTH символов), под которые попадает
+большая часть индекса, лучшие совпадения считаются при построении индекса.
+Индекс строится при первом обращении и перестраивается после изменения
+товаров (версия в кеше) или по истечении SUGGEST_MAX_AGE секунд.
+"""
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.urls import reverse
+
+from .models import Product, Category, Brand
+
+
+SUGGEST_LIMIT = getattr(settings, 'SUGGEST_LIMIT', 8)
+SUGGEST_MAX_AGE = getattr(settings, 'SUGGEST_MAX_AGE', 300)
+SUGGEST_CACHE_TIMEOUT = getattr(settings, 'SUGGEST_CACHE_TIMEOUT', 60)
+
+# Префиксы такой длины и короче ранжируются заранее
+SHORT_PREFIX_LENGTH = 2
+MAX_PREFIX_LENGTH = 50
+
+VERSION_KEY = 'suggest:version'
+
+WORD_START_RE = re.compile(r'(?:^|[\s\-/,.(])(?=\w)')
+
+
+def normalize(text):
+    """Ключ для сравнения: нижний регистр, ё -> е, одиночные пробелы"""
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+class PrefixIndex:
+    """Отсортированный массив ключей с payload для поиска по префиксу"""
+
+    def __init__(self, entries, version):
+        # entries: список (ключ, вес, тип, payload)
+        entries.sort(key=lambda entry: entry[0])
+        self.keys = [entry[0] for entry in entries]
+        self.entries = entries
+        self.version = version
+        self.built_at = time.monotonic()
+        self.short = {
+            prefix: self._best(*self._range(prefix), SUGGEST_LIMIT)
+            for prefix in {key[:length] for key in self.keys for length in range(1, SHORT_PREFIX_LENGTH + 1)}
+        }
+
+    def is_stale(self, version):
+        return version != self.version or time.monotonic() - self.built_at > SUGGEST_MAX_AGE
+
+    def _range(self, prefix):
+        """Границы ключей, начинающихся с prefix"""
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return bisect_left(self.keys, prefix), bisect_left(self.keys, upper)
+
+    def _best(self, start, end, limit):
+        """Лучшие по весу записи диапазона, по каждому типу отдельно"""
+        found = {}
+        for key, weight, kind, payload in self.entries[start:end]:
+            # Товар может попасть в выборку несколько раз (по разным словам)
+            found.setdefault((kind, payload['id']), (weight, kind, payload))
+
+        by_kind = {'products': [], 'brands': [], 'categories': []}
+        for item in found.values():
+            by_kind[item[1]].append(item)
+        return {
+            kind: [payload for _, _, payload in heapq.nlargest(limit, items, key=lambda item: item[0])]
+            for kind, items in by_kind.items()
+        }
+
+    def lookup(self, prefix, limit):
+        """Лучшие по весу совпадения для префикса, по каждому типу отдельно"""
+        if len(prefix) <= SHORT_PREFIX_LENGTH and limit <= SUGGEST_LIMIT:
+            best = self.short.get(prefix)
+            if best is None:
+                return {'products': [], 'brands': [], 'categories': []}
+            return {kind: payloads[:limit] for kind, payloads in best.items()}
+        return self._best(*self._range(prefix), limit)
+
+
+def _word_suffixes(text):
+    """Ключи для каждого слова: "мяч adidas" для "Футбольный мяч Adidas" и т.д."""
+    key = normalize(text)
+    return {key[match.end():] for match in WORD_START_RE.finditer(key)}
+
+
+def build_index(version=None):
+    """Построить индекс по активным товарам, брендам и категориям"""
+    image_storage = Product._meta.get_field('image').storage
+    entries = []
+    brand_views = {}
+
+    products = Product.objects.filter(is_active=True, in_stock=True).values_list(
+        'id', 'name', 'brand_id', 'views', 'price', 'discount_price', 'image'
+    )
+    for product_id, name, brand_id, views, price, discount_price, image in products.iterator():
+        payload = {
+            'id': product_id,
+            'name': name,
+            'price': float(discount_price or price),
+            'image': image_storage.url(image) if image else None,
+            'url': reverse('product_detail', args=[product_id]),
+        }
+        for key in _word_suffixes(name):
+            entries.append((key, views, 'products', payload))
+
+        if brand_id is not None:
+            brand_views[brand_id] = brand_views.get(brand_id, 0) + views
+
+    brands = Brand.objects.filter(pk__in=brand_views).values_list('id', 'name')
+    for brand_id, label in brands:
+        payload = {
+            'id': brand_id,
+            'name': label,
+            'url': f"{reverse('advanced_search')}?{urlencode({'brand': brand_id})}",
+        }
+        entries.append((normalize(label), brand_views[brand_id], 'brands', payload))
+
+    categories = Category.objects.annotate(total_views=Sum('products__views')).values_list(
+        'id', 'name', 'total_views'
+    )
+    for category_id, name, total in categories:
+        payload = {
+            'id': category_id,
+            'name': name,
+            'url': f"{reverse('catalog')}?category={category_id}",
+        }
+        for key in _word_suffixes(name):
+            entries.append((key, total or 0, 'categories', payload))
+
+    return PrefixIndex(entries, version)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """Индекс текущего процесса (перестраивается при устаревании)"""
+    global _index
+    version = cache.get(VERSION_KEY, 0)
+    index = _index
+    if index is None or index.is_stale(version):
+        with _lock:
+            if _index is None or _index.is_stale(version):
+                _index = build_index(version)
+            index = _index
+    return index
+
+
+def invalidate():
+    """Пометить индексы всех процессов устаревшими"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def suggest(query, limit=SUGGEST_LIMIT):
+    """Подсказки по префиксу (результат кешируется по префиксу и версии)"""
+    prefix = normalize(query)[:MAX_PREFIX_LENGTH]
+    if not prefix:
+        return {'products': [], 'brands': [], 'categories': []}
+
+    index = get_index()
+    cache_key = f'suggest:{index.version}:{limit}:{quote(prefix)}'
+    result = cache.get(cache_key)
+    if result is None:
+        result = index.lookup(prefix, limit)
+        cache.set(cache_key, result, SUGGEST_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,71 @@
+# sportshop/tasks.py
+"""
+Обработчики фоновых заданий (jobs.py). Ставятся в очередь через
+jobs.enqueue('<имя>', ...), выполняются командой run_workers.
+"""
+import logging
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db.models import F
+
+from . import search
+from .jobs import task, enqueue
+from .models import Order, Product, UserProfile
+
+
+logger = logging.getLogger(__name__)
+
+
+@task('send_email')
+def send_email(subject, body, to, html_body=None):
+    """Отправка письма (SMTP не задерживает запрос)"""
+    send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, to, html_message=html_body)
+
+
+@task('order_placed')
+def order_placed(order_id):
+    """Статистика покупателя и письмо-подтверждение после оформления заказа"""
+    order = Order.objects.select_related('user').get(pk=order_id)
+    UserProfile.objects.filter(user_id=order.user_id).update(
+        total_orders=F('total_orders') + 1,
+        total_spent=F('total_spent') + order.total_amount,
+    )
+    if order.user.email:
+        # Отдельное задание: ошибка почты не повторит обновление статистики
+        enqueue(
+            'send_email',
+            subject=f'Заказ #{order.order_number} оформлен',
+            body=(
+                f'Здравствуйте, {order.user.get_full_name() or order.user.username}!\n\n'
+                f'Ваш заказ #{order.order_number} на сумму {order.total_amount} руб. принят в обработку.'
+            ),
+            to=[order.user.email],
+        )
+
+
+@task('reindex_products')
+def reindex_products(category_id=None, brand_id=None, product_ids=None):
+    """Переиндексация товаров категории, бренда или списка (название входит в документ)"""
+    if product_ids is None:
+        products = Product.objects.filter(is_active=True)
+        if category_id is not None:
+            products = products.filter(category_id=category_id)
+        if brand_id is not None:
+            products = products.filter(brand_id=brand_id)
+        product_ids = list(products.values_list('id', flat=True))
+    search.index_products(product_ids)
+
+
+@task('order_status_changed')
+def order_status_changed(order_id, old_status, new_status):
+    """Журнал изменения статуса и уведомление покупателя"""
+    order = Order.objects.select_related('user').get(pk=order_id)
+    logger.info('Статус заказа #%s изменен: %s -> %s', order.order_number, old_status, new_status)
+    if order.user.email:
+        enqueue(
+            'send_email',
+            subject=f'Статус заказа #{order.order_number}',
+            body=f'Статус вашего заказа #{order.order_number}: {dict(Order.STATUS_CHOICES).get(new_status, new_status)}.',
+            to=[order.user.email],
+        )
@@ -0,0 +1,16 @@
+# sportshop/templatetags/product_cards.py
+from django import template
+
+from ..cards import render_cards
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_cards(products, variant):
+    """
+    Готовый HTML карточек товаров из кеша (см. cards.py):
+    {% product_cards products 'catalog' as cards %}
+    """
+    return render_cards(products, variant)
@@ -2,6 +2,7 @@
 from django.urls import path
 from . import views
 from django.contrib.auth import views as auth_views
+from .forms import QueuedPasswordResetForm
 from django.contrib.admin.views.decorators import staff_member_required
 urlpatterns = [
     # Главная страница
@@ -14,6 +15,7 @@ urlpatterns = [
     # Поиск
     path('search/', views.search, name='search'),
     path('search/advanced/', views.advanced_search, name='advanced_search'),
+    path('api/suggest/', views.api_suggest, name='api_suggest'),
 
     # Корзина
     path('cart/', views.cart_view, name='cart'),
@@ -34,7 +36,8 @@ urlpatterns = [
     # Восстановление пароля
     path('password-reset/',
          auth_views.PasswordResetView.as_view(
-             template_name='sportshop/password_reset.html'
+             template_name='sportshop/password_reset.html',
+             form_class=QueuedPasswordResetForm
          ),
          name='password_reset'),
 
@@ -0,0 +1,105 @@
+# sportshop/view_counter.py
+"""
+Буферизованный счетчик просмотров товаров (write-behind).
+
+Просмотры накапливаются в памяти процесса и периодически записываются в базу
+пачкой запросов UPDATE ... SET views = views + n (по одному запросу на каждое
+значение n). Запись выполняет фоновый поток раз в VIEW_COUNTER_FLUSH_INTERVAL
+секунд, а также выход процесса. При аварийном завершении теряются просмотры
+не более чем за один интервал.
+"""
+import atexit
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+
+from .models import Product
+
+
+VIEW_COUNTER_FLUSH_INTERVAL = getattr(settings, 'VIEW_COUNTER_FLUSH_INTERVAL', 10)
+# Без фонового потока запись выполняется в запросе, когда истек интервал
+VIEW_COUNTER_BACKGROUND = getattr(settings, 'VIEW_COUNTER_BACKGROUND', True)
+# Количество товаров в одном UPDATE
+VIEW_COUNTER_BATCH_SIZE = 500
+
+_pending = defaultdict(int)
+_lock = threading.Lock()
+_flusher = None
+_last_flush = time.monotonic()
+
+
+def record_view(product_id):
+    """Учесть просмотр товара"""
+    with _lock:
+        _pending[product_id] += 1
+
+    if VIEW_COUNTER_BACKGROUND:
+        _ensure_flusher()
+    elif time.monotonic() - _last_flush >= VIEW_COUNTER_FLUSH_INTERVAL:
+        flush()
+
+
+def pending_views(product_id):
+    """Просмотры товара, еще не записанные в базу этим процессом"""
+    with _lock:
+        return _pending.get(product_id, 0)
+
+
+def flush():
+    """Записать накопленные просмотры в базу. Возвращает количество товаров"""
+    global _pending, _last_flush
+    with _lock:
+        pending, _pending = _pending, defaultdict(int)
+        _last_flush = time.monotonic()
+    if not pending:
+        return 0
+
+    # Группируем товары с одинаковым приращением: один UPDATE на значение
+    by_increment = defaultdict(list)
+    for product_id, count in pending.items():
+        by_increment[count].append(product_id)
+
+    batches = []
+    for count, product_ids in by_increment.items():
+        # Сортировка id - единый порядок блокировки строк между процессами
+        product_ids.sort()
+        for start in range(0, len(product_ids), VIEW_COUNTER_BATCH_SIZE):
+            batches.append((count, product_ids[start:start + VIEW_COUNTER_BATCH_SIZE]))
+
+    for position, (count, product_ids) in enumerate(batches):
+        try:
+            Product.objects.filter(pk__in=product_ids).update(views=F('views') + count)
+        except Exception as e:
+            # Незаписанные просмотры возвращаем в буфер до следующей записи
+            with _lock:
+                for count, product_ids in batches[position:]:
+                    for product_id in product_ids:
+                        _pending[product_id] += count
+            print(f"Ошибка записи просмотров: {e}")
+            break
+
+    return len(pending)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(VIEW_COUNTER_FLUSH_INTERVAL)
+        close_old_connections()
+        flush()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name='view-counter-flusher', daemon=True)
+            _flusher.start()
+
+
+atexit.register(flush)
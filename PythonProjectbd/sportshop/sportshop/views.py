@@ -5,33 +5,101 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib import messages
-from django.db.models import Q, Count, Sum, Avg
+from django.db import transaction
+from django.db.models import Q, Count, Sum
 from django.core.paginator import Paginator
 from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.urls import reverse
+from django.views.decorators.http import require_POST, require_GET
+from django.views.decorators.cache import cache_control
 from django.utils import timezone
 import json
 import uuid
+from decimal import Decimal
+
+from .models import (
+    Product, Category, Brand, Order, OrderItem, Review, UserProfile, Address, Cart, CartItem,
+    ProductRecommendation,
+)
+from .permissions import customer_required, customer_or_anonymous, manager_required, admin_required
+from .search import search_product_ids
+from .suggest import suggest
+from .pagination import KeysetPaginator, CountedPaginator
+from .counting import cached_count, cached_aggregate, cached_group_count, table_count, listing_count
+from .fragments import home_version, HOME_CACHE_TIMEOUT
+from . import sampling, facets, catalog_engine, product_cache, jobs
+from .view_counter import record_view, pending_views
+from .cart_summary import get_cart_summary, reset_cart_summary
+from .shopping_cart import get_cart, UserCart
+from .reservations import InsufficientStock
+from .idempotency import idempotent
+from . import reservations
+
+
+# Ключи сортировки для курсорной пагинации (последнее поле - уникальное)
+CATALOG_ORDERINGS = {
+    'name': ('name', 'id'),
+    '-name': ('-name', 'id'),
+    'price': ('effective_price', 'id'),
+    '-price': ('-effective_price', 'id'),
+    'rating': ('-rating', 'id'),
+    'popular': ('-views', 'id'),
+    '-created_at': ('-created_at', 'id'),
+}
+
+ADVANCED_SEARCH_ORDERINGS = {
+    'price_asc': ('effective_price', 'id'),
+    'price_desc': ('-effective_price', 'id'),
+    'rating': ('-rating', '-views', 'id'),
+    'popular': ('-views', '-rating', 'id'),
+    'newest': ('-created_at', 'id'),
+}
+
+
+def products_page_json(request, page):
+    """JSON-вариант страницы товаров для бесконечной прокрутки"""
+    products = []
+    for product in page:
+        products.append({
+            'id': product.id,
+            'name': product.name,
+            'url': reverse('product_detail', args=[product.id]),
+            'image': product.image.url if product.image else None,
+            'category': product.category.name if product.category_id else '',
+            'price': float(product.price),
+            'discount_price': float(product.discount_price) if product.discount_price else None,
+            'discount_percentage': product.discount_percent,
+            'rating': float(product.rating),
+            'in_stock': product.in_stock,
+        })
 
-from .models import Product, Category, Order, OrderItem, Review, UserProfile, Address, Cart, CartItem
-from .permissions import customer_required, manager_required, admin_required
+    next_url = None
+    if page.has_next():
+        next_url = f'{request.path}?{page.next_query}&format=json'
+
+    return JsonResponse({
+        'products': products,
+        'has_next': page.has_next(),
+        'next_url': next_url,
+    })
 
 
 # ==================== ГЛАВНАЯ СТРАНИЦА ====================
 def home(request):
-    """Главная страница с приветствием пользователя"""
+    """
+    Главная страница с приветствием пользователя.
+    Общие секции кешируются фрагментами (querysets ленивые и выполняются
+    только при промахе кеша), на каждый запрос считается лишь блок приветствия.
+    """
     try:
         # Получаем товары для разных секций
         featured_products = Product.objects.filter(
             in_stock=True,
             is_active=True
-        ).order_by('-rating', '-created_at')[:8]
+        ).select_related('category').order_by('-rating', '-created_at')[:8]
 
-        discounted_products = Product.objects.filter(
-            discount_price__isnull=False,
-            in_stock=True,
-            is_active=True
-        ).order_by('?')[:6]
+        # Случайные товары со скидкой из заранее собранного пула (выбираются на каждый запрос)
+        discounted_products = sampling.discounted_products.sample(6)
 
         # Новинки
         new_products = Product.objects.filter(
@@ -41,38 +109,25 @@ def home(request):
         )[:6]
 
         # Категории с товарами
-        categories = Category.objects.annotate(
-            product_count=Count('products')
-        ).filter(product_count__gt=0)[:6]
+        categories = Category.objects.filter(active_product_count__gt=0)[:6]
 
-        # Данные для приветствия пользователя
         context = {
             'featured_products': featured_products,
             'discounted_products': discounted_products,
             'new_products': new_products,
             'categories': categories,
+            'home_version': home_version(),
+            'home_cache_timeout': HOME_CACHE_TIMEOUT,
         }
 
         # Если пользователь авторизован, добавляем его данные
+        # (количество товаров в корзине добавляет контекстный процессор)
         if request.user.is_authenticated:
-            # Получаем профиль пользователя
             profile, created = UserProfile.objects.get_or_create(user=request.user)
 
-            # Получаем заказы пользователя
-            orders_count = Order.objects.filter(user=request.user).count()
-
-            # Получаем корзину
-            cart = Cart.objects.filter(user=request.user).first()
-            cart_count = cart.get_total_quantity() if cart else 0
-
-            # Получаем группы пользователя
-            user_groups = request.user.groups.values_list('name', flat=True)
-
             context.update({
-                'orders_count': orders_count,
+                'orders_count': Order.objects.filter(user=request.user).count(),
                 'bonus_points': profile.bonus_points,
-                'cart_count': cart_count,
-                'user_groups': user_groups,
             })
 
         return render(request, 'sportshop/index.html', context)
@@ -84,15 +139,15 @@ def home(request):
             'discounted_products': [],
             'new_products': [],
             'categories': [],
+            # Пустые секции не кешируем
+            'home_version': 'error',
+            'home_cache_timeout': 0,
         }
 
         if request.user.is_authenticated:
-            user_groups = request.user.groups.values_list('name', flat=True)
             context.update({
                 'orders_count': 0,
                 'bonus_points': 0,
-                'cart_count': 0,
-                'user_groups': user_groups,
             })
 
         return render(request, 'sportshop/index.html', context)
@@ -105,45 +160,44 @@ def search(request):
     """
     query = request.GET.get('q', '').strip()
 
-    products = Product.objects.filter(in_stock=True, is_active=True)
-
-    if query:
-        # Разбиваем запрос на слова для более точного поиска
-        words = query.split()
-
-        # Создаем Q-объект для каждого слова
-        q_objects = Q()
-        for word in words:
-            q_objects |= Q(name__icontains=word) | Q(description__icontains=word)
-
-        products = products.filter(q_objects)
-
-        # Если ничего не найдено, ищем по категориям и брендам
-        if not products.exists():
-            products = Product.objects.filter(
-                Q(category__name__icontains=query) |
-                Q(brand__icontains=query)
-            ).filter(in_stock=True, is_active=True)
-    else:
-        products = Product.objects.none()
+    # Id активных товаров в наличии из поискового индекса, отсортированные по
+    # релевантности (BM25). Название категории и бренд входят в индекс,
+    # поэтому отдельный поиск по ним не нужен.
+    ranked_ids = search_product_ids(query) if query else []
 
-    # Сортировка по релевантности
-    products = products.order_by('-rating', '-created_at')
-
-    # Пагинация
-    paginator = Paginator(products, 20)
+    # Пагинация по списку id, товары загружаются только для текущей страницы
+    paginator = Paginator(ranked_ids, 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
+    products_by_id = Product.objects.in_bulk(list(page_obj.object_list))
+    page_obj.object_list = [
+        products_by_id[product_id] for product_id in page_obj.object_list
+        if product_id in products_by_id
+    ]
+
     context = {
         'query': query,
         'products': page_obj,
-        'results_count': products.count(),
+        'results_count': len(ranked_ids),
         'search_type': 'contextual',
     }
     return render(request, 'sportshop/search_results.html', context)
 
 
+# ==================== ПОДСКАЗКИ ПОИСКА ====================
+@require_GET
+@cache_control(public=True, max_age=60)
+def api_suggest(request):
+    """
+    Автодополнение для строки поиска (JSON).
+    Отвечает из индекса в памяти, без обращения к базе данных.
+    """
+    query = request.GET.get('q', '').strip()
+    result = suggest(query) if len(query) >= 2 else {'products': [], 'brands': [], 'categories': []}
+    return JsonResponse({'query': query, **result})
+
+
 # ==================== АТРИБУТНЫЙ ПОИСК ====================
 def advanced_search(request):
     """
@@ -157,13 +211,19 @@ def advanced_search(request):
 
     # Фильтр по текстовому запросу
     query = request.GET.get('q', '').strip()
+    text_matches = None
     if query:
-        products = products.filter(
+        # Бренды ищем в небольшой таблице брендов, товары фильтруем по id
+        brand_ids = list(Brand.objects.filter(name__icontains=query).values_list('id', flat=True))
+        text_filter = (
             Q(name__icontains=query) |
             Q(description__icontains=query) |
             Q(category__name__icontains=query) |
-            Q(brand__icontains=query)
+            Q(brand_id__in=brand_ids)
         )
+        # Подзапрос: найденные id не передаются через Python
+        text_matches = products.filter(text_filter).values('pk')
+        products = products.filter(pk__in=text_matches)
         filters['q'] = query
         has_filters = True
 
@@ -178,19 +238,26 @@ def advanced_search(request):
     price_min = request.GET.get('price_min')
     price_max = request.GET.get('price_max')
     if price_min and price_min.isdigit():
-        products = products.filter(price__gte=int(price_min))
+        products = products.filter(effective_price__gte=int(price_min))
         filters['price_min'] = price_min
         has_filters = True
     if price_max and price_max.isdigit():
-        products = products.filter(price__lte=int(price_max))
+        products = products.filter(effective_price__lte=int(price_max))
         filters['price_max'] = price_max
         has_filters = True
 
-    # Фильтр по бренду
+    # Фильтр по бренду (id; название поддерживается для старых ссылок)
     brand = request.GET.get('brand')
+    brand_id = None
     if brand and brand != 'all':
-        products = products.filter(brand__iexact=brand)
-        filters['brand'] = brand
+        if brand.isdigit():
+            brand_id = int(brand)
+        else:
+            brand_id = Brand.objects.filter(
+                normalized_name=Brand.normalize(brand)
+            ).values_list('id', flat=True).first() or 0
+        products = products.filter(brand_id=brand_id)
+        filters['brand'] = str(brand_id)
         has_filters = True
 
     # Фильтр по наличию
@@ -209,39 +276,65 @@ def advanced_search(request):
 
     # Сортировка
     sort_by = request.GET.get('sort', '-created_at')
-    if sort_by == 'price_asc':
-        products = products.order_by('price')
-    elif sort_by == 'price_desc':
-        products = products.order_by('-price')
-    elif sort_by == 'rating':
-        products = products.order_by('-rating', '-views')
-    elif sort_by == 'popular':
-        products = products.order_by('-views', '-rating')
-    elif sort_by == 'newest':
-        products = products.order_by('-created_at')
-    else:
-        products = products.order_by('-created_at')
+    ordering = ADVANCED_SEARCH_ORDERINGS.get(sort_by, ('-created_at', 'id'))
     filters['sort'] = sort_by
 
-    # Пагинация
-    paginator = Paginator(products, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    # Получаем данные для фильтров
-    categories = Category.objects.all()
-    brands = Product.objects.filter(
+    # Страница из движка каталога в памяти (если включен), иначе курсорная пагинация в базе
+    engine_result = None
+    if not query:
+        engine_result = catalog_engine.get_page(
+            request, ordering, 20,
+            category_id=int(category_id) if category_id and category_id.isdigit() else None,
+            price_min=int(price_min) if 'price_min' in filters else None,
+            price_max=int(price_max) if 'price_max' in filters else None,
+            brand=brand_id,
+            has_discount='has_discount' in filters,
+        )
+    if engine_result is not None:
+        page_obj, results_count = engine_result
+    else:
+        paginator = KeysetPaginator(products.select_related('category', 'brand'), ordering, 20)
+        page_obj = paginator.get_page(request)
+        results_count = None
+
+    if request.GET.get('format') == 'json':
+        return products_page_json(request, page_obj)
+
+    # Количество товаров по значениям фильтров (битовые карты, см. facets.py)
+    facet_index = facets.get_index()
+    facet_counts = facet_index.counts(
+        category=int(category_id) if category_id and category_id.isdigit() else None,
+        brand=brand_id,
+        price_min=int(price_min) if 'price_min' in filters else None,
+        price_max=int(price_max) if 'price_max' in filters else None,
+        has_discount='has_discount' in filters,
         in_stock=True,
-        is_active=True
-    ).exclude(brand='').values_list('brand', flat=True).distinct()
+        # Id текстового поиска нужны только для фасетов (не для JSON-страниц)
+        ids=facet_index.ids_bits(text_matches.values_list('pk', flat=True)) if text_matches is not None else None,
+    )
+
+    # Ссылки на ценовые диапазоны с сохранением остальных фильтров
+    for bucket in facet_counts['price_buckets']:
+        params = request.GET.copy()
+        for key in ('cursor', 'page', 'format', 'price_min', 'price_max'):
+            params.pop(key, None)
+        if bucket['min'] is not None:
+            params['price_min'] = bucket['min']
+        if bucket['max'] is not None:
+            params['price_max'] = bucket['max']
+        bucket['query'] = params.urlencode()
 
     context = {
         'products': page_obj,
-        'categories': categories,
-        'brands': brands,
+        'categories': facet_counts['categories'],
+        'brands': facet_counts['brands'],
+        'price_buckets': facet_counts['price_buckets'],
+        'discount_count': facet_counts['has_discount'],
         'filters': filters,
         'has_filters': has_filters,
-        'results_count': products.count(),
+        # Общее количество - из того же источника, что и список (битовые карты
+        # фасетов могут отставать от базы до FACETS_MAX_AGE секунд)
+        'results_count': results_count if results_count is not None else cached_count(products, request),
         'search_type': 'advanced',
     }
     return render(request, 'sportshop/advanced_search.html', context)
@@ -251,7 +344,7 @@ def advanced_search(request):
 def product_list(request):
     """Страница каталога товаров"""
     products = Product.objects.filter(in_stock=True, is_active=True)
-    categories = Category.objects.annotate(product_count=Count('products')).filter(product_count__gt=0)
+    categories = Category.objects.filter(active_product_count__gt=0)
 
     # Фильтрация по поисковому запросу
     query = request.GET.get('q')
@@ -271,36 +364,37 @@ def product_list(request):
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
     if min_price and min_price.isdigit():
-        products = products.filter(price__gte=int(min_price))
+        products = products.filter(effective_price__gte=int(min_price))
     if max_price and max_price.isdigit():
-        products = products.filter(price__lte=int(max_price))
+        products = products.filter(effective_price__lte=int(max_price))
 
     # Сортировка
     sort_by = request.GET.get('sort', '-created_at')
-    if sort_by == 'name':
-        products = products.order_by('name')
-    elif sort_by == '-name':
-        products = products.order_by('-name')
-    elif sort_by == 'price':
-        products = products.order_by('price')
-    elif sort_by == '-price':
-        products = products.order_by('-price')
-    elif sort_by == 'rating':
-        products = products.order_by('-rating')
-    elif sort_by == 'popular':
-        products = products.order_by('-views')
+    ordering = CATALOG_ORDERINGS.get(sort_by, CATALOG_ORDERINGS['-created_at'])
+
+    # Страница из движка каталога в памяти (если включен), иначе курсорная пагинация в базе
+    engine_result = None
+    if not query:
+        engine_result = catalog_engine.get_page(
+            request, ordering, 12,
+            category_id=int(category_id) if category_id and category_id.isdigit() else None,
+            price_min=int(min_price) if min_price and min_price.isdigit() else None,
+            price_max=int(max_price) if max_price and max_price.isdigit() else None,
+        )
+    if engine_result is not None:
+        page_obj, total_products = engine_result
     else:
-        products = products.order_by('-created_at')
+        paginator = KeysetPaginator(products.select_related('category'), ordering, 12)
+        page_obj = paginator.get_page(request)
+        total_products = None
 
-    # Пагинация
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if request.GET.get('format') == 'json':
+        return products_page_json(request, page_obj)
 
     context = {
         'products': page_obj,
         'categories': categories,
-        'total_products': products.count(),
+        'total_products': total_products if total_products is not None else cached_count(products, request),
         'sort_by': sort_by,
     }
     return render(request, 'sportshop/catalog.html', context)
@@ -309,14 +403,27 @@ def product_list(request):
 # ==================== ДЕТАЛЬНАЯ СТРАНИЦА ТОВАРА ====================
 def product_detail(request, product_id):
     """Детальная страница товара"""
-    product = get_object_or_404(Product, id=product_id, is_active=True)
+    # Товар с категорией и брендом из кеша (см. product_cache.py)
+    product = product_cache.get_product_or_404(product_id, is_active=True)
 
-    # Похожие товары (той же категории)
-    similar_products = Product.objects.filter(
-        category=product.category,
-        in_stock=True,
-        is_active=True
-    ).exclude(id=product_id)[:4]
+    # Часто покупают вместе (таблица строится командой build_recommendations)
+    similar_products = [
+        recommendation.recommended
+        for recommendation in ProductRecommendation.objects.filter(
+            product=product,
+            recommended__in_stock=True,
+            recommended__is_active=True
+        ).select_related('recommended')[:4]
+    ]
+    bought_together = bool(similar_products)
+
+    # Если покупок мало - похожие товары той же категории
+    if not bought_together:
+        similar_products = Product.objects.filter(
+            category=product.category,
+            in_stock=True,
+            is_active=True
+        ).exclude(id=product_id)[:4]
 
     # Отзывы к товару
     reviews = Review.objects.filter(
@@ -324,23 +431,25 @@ def product_detail(request, product_id):
         is_published=True
     ).order_by('-created_at')
 
-    # Увеличиваем счетчик просмотров
-    product.views += 1
-    product.save(update_fields=['views'])
+    # Увеличиваем счетчик просмотров (запись в базу пачками, см. view_counter.py)
+    record_view(product.id)
+    product.views += pending_views(product.id)
 
     context = {
         'product': product,
         'similar_products': similar_products,
+        'bought_together': bought_together,
         'reviews': reviews,
-        'reviews_count': reviews.count(),
-        'average_rating': reviews.aggregate(avg_rating=Avg('rating'))['avg_rating'] or 0,
+        'reviews_count': product.review_count,
+        'average_rating': product.rating,
     }
     return render(request, 'sportshop/product_detail.html', context)
 
 
 # ==================== БЫСТРОЕ ДОБАВЛЕНИЕ В КОРЗИНУ ====================
 @require_POST
-@login_required
+@customer_or_anonymous
+@idempotent
 def quick_add_to_cart(request):
     """
     Быстрое добавление в корзину с главной страницы (без указания количества)
@@ -349,7 +458,7 @@ def quick_add_to_cart(request):
         data = json.loads(request.body)
         product_id = data.get('product_id')
 
-        product = get_object_or_404(Product, id=product_id)
+        product = product_cache.get_product_or_404(product_id)
 
         # Проверяем наличие товара
         if not product.in_stock or product.stock_quantity <= 0:
@@ -358,27 +467,25 @@ def quick_add_to_cart(request):
                 'message': f'Товар "{product.name}" отсутствует на складе'
             })
 
-        cart, created = Cart.objects.get_or_create(user=request.user)
-
-        # Проверяем, есть ли уже товар в корзине
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': 1}
-        )
+        try:
+            get_cart(request).add(product, 1)
+        except InsufficientStock:
+            return JsonResponse({
+                'success': False,
+                'message': f'Товар "{product.name}" закончился или зарезервирован другими покупателями'
+            })
 
-        if not created:
-            cart_item.quantity += 1
-            cart_item.save()
+        reset_cart_summary(request)
+        summary = get_cart_summary(request)
 
         # Возвращаем JSON для AJAX
         return JsonResponse({
             'success': True,
-            'cart_count': cart.get_total_quantity(),
+            'cart_count': summary['quantity'],
             'message': f'Товар "{product.name}" добавлен в корзину',
             'product_name': product.name,
             'product_price': float(product.get_final_price()),
-            'cart_total': float(cart.get_total_price()),
+            'cart_total': float(summary['total']),
         })
 
     except Exception as e:
@@ -389,21 +496,22 @@ def quick_add_to_cart(request):
 
 
 # ==================== КОРЗИНА ====================
-@customer_required
+@customer_or_anonymous
 def cart_view(request):
-    """Просмотр корзины"""
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_items = cart.items.select_related('product').all()
+    """Просмотр корзины (пользователя или анонимного посетителя)"""
+    cart = get_cart(request)
+    cart_items = cart.lines()
 
-    # Расчет итогов
-    subtotal = sum(item.get_total_price() for item in cart_items)
+    # Расчет итогов (тот же результат использует контекстный процессор)
+    summary = get_cart_summary(request)
+    subtotal = summary['total']
     delivery_cost = 0  # Базовая стоимость доставки
     grand_total = subtotal + delivery_cost
 
     context = {
         'cart': cart,
         'cart_items': cart_items,
-        'cart_total_quantity': cart.get_total_quantity(),
+        'cart_total_quantity': summary['quantity'],
         'cart_subtotal': subtotal,
         'cart_discount': 0,
         'cart_grand_total': grand_total,
@@ -413,17 +521,18 @@ def cart_view(request):
 
 
 @require_POST
-@customer_required
+@customer_or_anonymous
+@idempotent
 def add_to_cart(request, product_id):
     """Добавление товара в корзину (AJAX)"""
-    product = get_object_or_404(Product, id=product_id)
-    cart, created = Cart.objects.get_or_create(user=request.user)
+    product = product_cache.get_product_or_404(product_id)
 
     try:
         data = json.loads(request.body)
         quantity = int(data.get('quantity', 1))
     except:
         quantity = 1
+    quantity = max(quantity, 1)
 
     # Проверяем наличие
     if not product.in_stock or product.stock_quantity < quantity:
@@ -432,33 +541,32 @@ def add_to_cart(request, product_id):
             'message': f'Недостаточно товара "{product.name}" на складе'
         })
 
-    # Проверяем, есть ли уже товар в корзине
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product,
-        defaults={'quantity': quantity}
-    )
+    try:
+        item_quantity = get_cart(request).add(product, quantity)
+    except InsufficientStock:
+        return JsonResponse({
+            'success': False,
+            'message': f'Недостаточно товара "{product.name}" на складе'
+        })
 
-    if not created:
-        cart_item.quantity += quantity
-        cart_item.save()
+    reset_cart_summary(request)
+    summary = get_cart_summary(request)
 
     # Возвращаем JSON для AJAX
     return JsonResponse({
         'success': True,
-        'cart_count': cart.get_total_quantity(),
-        'item_total': cart_item.get_total_price(),
-        'cart_subtotal': cart.get_total_price(),
+        'cart_count': summary['quantity'],
+        'item_total': product.get_final_price() * item_quantity,
+        'cart_subtotal': summary['total'],
         'message': f'Товар "{product.name}" добавлен в корзину'
     })
 
 
 @require_POST
-@customer_required
+@customer_or_anonymous
 def update_cart_item(request, product_id):
     """Обновление количества товара в корзине (AJAX)"""
-    product = get_object_or_404(Product, id=product_id)
-    cart = get_object_or_404(Cart, user=request.user)
+    product = product_cache.get_product_or_404(product_id)
 
     try:
         data = json.loads(request.body)
@@ -466,49 +574,50 @@ def update_cart_item(request, product_id):
     except:
         return JsonResponse({'success': False, 'error': 'Неверный формат данных'})
 
-    try:
-        cart_item = CartItem.objects.get(cart=cart, product=product)
-
-        # Проверяем наличие на складе
-        if quantity > product.stock_quantity:
-            return JsonResponse({
-                'success': False,
-                'error': f'На складе только {product.stock_quantity} шт.'
-            })
+    # Проверяем наличие на складе
+    if quantity > product.stock_quantity:
+        return JsonResponse({
+            'success': False,
+            'error': f'На складе только {product.stock_quantity} шт.'
+        })
 
-        if quantity <= 0:
-            cart_item.delete()
-        else:
-            cart_item.quantity = quantity
-            cart_item.save()
-    except CartItem.DoesNotExist:
+    try:
+        changed = get_cart(request).set_quantity(product, quantity)
+    except InsufficientStock:
+        return JsonResponse({
+            'success': False,
+            'error': 'Недостаточно товара на складе (часть остатка зарезервирована)'
+        })
+    if not changed:
         return JsonResponse({'success': False, 'error': 'Товар не найден в корзине'})
 
+    reset_cart_summary(request)
+    summary = get_cart_summary(request)
+
     return JsonResponse({
         'success': True,
-        'cart_count': cart.get_total_quantity(),
-        'item_total': cart_item.get_total_price() if quantity > 0 else 0,
-        'cart_subtotal': cart.get_total_price(),
+        'cart_count': summary['quantity'],
+        'item_total': product.get_final_price() * quantity if quantity > 0 else 0,
+        'cart_subtotal': summary['total'],
     })
 
 
 @require_POST
-@customer_required
+@customer_or_anonymous
 def remove_from_cart(request, product_id):
     """Удаление товара из корзины (AJAX)"""
-    product = get_object_or_404(Product, id=product_id)
-    cart = get_object_or_404(Cart, user=request.user)
+    product = product_cache.get_product_or_404(product_id)
 
-    try:
-        cart_item = CartItem.objects.get(cart=cart, product=product)
-        cart_item.delete()
-    except CartItem.DoesNotExist:
+    if not get_cart(request).remove(product):
         return JsonResponse({'success': False, 'error': 'Товар не найден в корзине'})
 
+    reset_cart_summary(request)
+    summary = get_cart_summary(request)
+
     return JsonResponse({
         'success': True,
-        'cart_count': cart.get_total_quantity(),
-        'cart_subtotal': cart.get_total_price(),
+        'cart_count': summary['quantity'],
+        'cart_subtotal': summary['total'],
     })
 
 
@@ -552,9 +661,15 @@ def customer_account(request):
 
     # Статистика пользователя
     orders = Order.objects.filter(user=user)
-    total_orders = orders.count()
-    total_spent = orders.aggregate(total=Sum('total_amount'))['total'] or 0
-    active_orders = orders.filter(status__in=['pending', 'processing', 'shipped']).count()
+    order_stats = cached_aggregate(
+        orders, request,
+        total_orders=Count('id'),
+        total_spent=Sum('total_amount'),
+        active_orders=Count('id', filter=Q(status__in=['pending', 'processing', 'shipped'])),
+    )
+    total_orders = order_stats['total_orders']
+    total_spent = order_stats['total_spent'] or 0
+    active_orders = order_stats['active_orders']
 
     # Последние заказы
     recent_orders = orders.order_by('-created_at')[:5]
@@ -585,14 +700,15 @@ def account_orders(request):
     """Страница заказов пользователя"""
     orders = Order.objects.filter(user=request.user).order_by('-created_at')
 
-    # Пагинация
-    paginator = Paginator(orders, 10)
+    # Пагинация (количество считается один раз)
+    total_orders = cached_count(orders, request)
+    paginator = CountedPaginator(orders, 10, count=total_orders)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
     context = {
         'orders': page_obj,
-        'total_orders': orders.count(),
+        'total_orders': total_orders,
         'section': 'orders',
     }
     return render(request, 'sportshop/customer_orders.html', context)
@@ -715,17 +831,27 @@ def admin_dashboard(request):
     # Статистика
     today = timezone.now().date()
 
+    # Начало недели округляем до минуты, чтобы агрегат попадал в кеш
+    week_ago = (timezone.now() - timezone.timedelta(days=7)).replace(second=0, microsecond=0)
+
+    # Все показатели по заказам одним запросом
+    order_stats = cached_aggregate(
+        Order.objects.all(), request,
+        pending_orders=Count('id', filter=Q(status='pending')),
+        revenue=Sum('total_amount', filter=Q(status='delivered')),
+        today_orders=Count('id', filter=Q(created_at__date=today)),
+        weekly_revenue=Sum('total_amount', filter=Q(created_at__gte=week_ago, status='delivered')),
+    )
+
     stats = {
-        'total_orders': Order.objects.count(),
-        'pending_orders': Order.objects.filter(status='pending').count(),
-        'total_users': User.objects.count(),
-        'total_products': Product.objects.count(),
-        'revenue': Order.objects.filter(status='delivered').aggregate(total=Sum('total_amount'))['total'] or 0,
-        'today_orders': Order.objects.filter(created_at__date=today).count(),
-        'weekly_revenue': Order.objects.filter(
-            created_at__gte=timezone.now() - timezone.timedelta(days=7),
-            status='delivered'
-        ).aggregate(total=Sum('total_amount'))['total'] or 0,
+        'total_orders': table_count(Order, request),
+        'pending_orders': order_stats['pending_orders'],
+        'total_users': table_count(User, request),
+        'total_products': table_count(Product, request),
+        'revenue': order_stats['revenue'] or 0,
+        'today_orders': order_stats['today_orders'],
+        'weekly_revenue': order_stats['weekly_revenue'] or 0,
+        'product_cache': product_cache.stats(),
     }
 
     # Последние заказы
@@ -754,51 +880,6 @@ def admin_dashboard(request):
     return render(request, 'sportshop/admin_dashboard.html', context)
 
 
-@manager_required
-def admin_products(request):
-    """Управление товарами (для менеджеров и администраторов)"""
-    products = Product.objects.all().order_by('-created_at')
-
-    # Фильтрация
-    category_id = request.GET.get('category')
-    if category_id and category_id != 'all':
-        products = products.filter(category_id=category_id)
-
-    in_stock = request.GET.get('in_stock')
-    if in_stock == 'true':
-        products = products.filter(in_stock=True)
-    elif in_stock == 'false':
-        products = products.filter(in_stock=False)
-
-    # Поиск
-    query = request.GET.get('q')
-    if query:
-        products = products.filter(
-            Q(name__icontains=query) |
-            Q(sku__icontains=query) |
-            Q(description__icontains=query)
-        )
-
-    # Пагинация
-    paginator = Paginator(products, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    categories = Category.objects.all()
-
-    # Группы пользователя
-    user_groups = request.user.groups.values_list('name', flat=True)
-
-    context = {
-        'products': page_obj,
-        'categories': categories,
-        'total_products': products.count(),
-        'user_groups': user_groups,
-        'section': 'products',
-    }
-    return render(request, 'sportshop/products.html', context)
-
-
 @manager_required
 def admin_orders(request):
     """Управление заказами (для менеджеров и администраторов)"""
@@ -818,30 +899,22 @@ def admin_orders(request):
             Q(recipient_name__icontains=query)
         )
 
-    # Счетчики для фильтров
-    status_counts = {
-        'pending': Order.objects.filter(status='pending').count(),
-        'processing': Order.objects.filter(status='processing').count(),
-        'delivered': Order.objects.filter(status='delivered').count(),
-    }
+    # Счетчики для фильтров (один GROUP BY по статусу)
+    status_counts = cached_group_count(Order.objects.all(), 'status', request)
 
-    # Сортировка
-    orders = orders.order_by('-created_at')
-
-    # Пагинация
-    paginator = Paginator(orders, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Курсорная пагинация (сначала новые)
+    paginator = KeysetPaginator(orders, ('-created_at', 'id'), 20)
+    page_obj = paginator.get_page(request)
 
     # Группы пользователя
     user_groups = request.user.groups.values_list('name', flat=True)
 
     context = {
         'orders': page_obj,
-        'total_orders': orders.count(),
-        'pending_count': status_counts['pending'],
-        'processing_count': status_counts['processing'],
-        'delivered_count': status_counts['delivered'],
+        'total_orders': listing_count(orders, request),
+        'pending_count': status_counts.get('pending', 0),
+        'processing_count': status_counts.get('processing', 0),
+        'delivered_count': status_counts.get('delivered', 0),
         'status_choices': Order.STATUS_CHOICES,
         'user_groups': user_groups,
         'section': 'orders',
@@ -878,8 +951,9 @@ def admin_users(request):
             Q(last_name__icontains=query)
         )
 
-    # Пагинация
-    paginator = Paginator(users, 20)
+    # Пагинация (количество считается один раз)
+    total_users = listing_count(users, request)
+    paginator = CountedPaginator(users, 20, count=total_users)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
@@ -891,7 +965,7 @@ def admin_users(request):
     context = {
         'users': page_obj,
         'groups': groups,
-        'total_users': users.count(),
+        'total_users': total_users,
         'user_groups': user_groups,
         'section': 'users',
     }
@@ -922,18 +996,19 @@ def admin_order_history(request):
     # Сортировка по дате (сначала новые)
     orders = orders.order_by('-created_at')
 
-    # Статистика
-    stats = {
-        'total_orders': orders.count(),
-        'total_amount': orders.aggregate(total=Sum('total_amount'))['total'] or 0,
-        'pending_orders': orders.filter(status='pending').count(),
-        'completed_orders': orders.filter(status='delivered').count(),
-    }
+    # Статистика (все показатели одним запросом)
+    stats = cached_aggregate(
+        orders, request,
+        total_orders=Count('id'),
+        total_amount=Sum('total_amount'),
+        pending_orders=Count('id', filter=Q(status='pending')),
+        completed_orders=Count('id', filter=Q(status='delivered')),
+    )
+    stats['total_amount'] = stats['total_amount'] or 0
 
-    # Пагинация
-    paginator = Paginator(orders, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Курсорная пагинация
+    paginator = KeysetPaginator(orders, ('-created_at', 'id'), 20)
+    page_obj = paginator.get_page(request)
 
     # Все пользователи для фильтра
     users = User.objects.all().order_by('username')
@@ -980,10 +1055,9 @@ def admin_products(request):
     # Проверяем, может ли пользователь удалять товары
     can_delete = request.user.is_superuser or request.user.groups.filter(name='administrator').exists()
 
-    # Пагинация
-    paginator = Paginator(products, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Курсорная пагинация
+    paginator = KeysetPaginator(products.select_related('category'), ('-created_at', 'id'), 20)
+    page_obj = paginator.get_page(request)
 
     categories = Category.objects.all()
 
@@ -993,7 +1067,7 @@ def admin_products(request):
     context = {
         'products': page_obj,
         'categories': categories,
-        'total_products': products.count(),
+        'total_products': listing_count(products, request),
         'user_groups': user_groups,
         'can_delete': can_delete,  # Передаем в шаблон
         'section': 'products',
@@ -1003,10 +1077,11 @@ def admin_products(request):
 
 # ==================== ЗАКАЗЫ ====================
 @customer_required
+@idempotent
 def checkout(request):
     """Страница оформления заказа"""
     cart = get_object_or_404(Cart, user=request.user)
-    cart_items = cart.items.all()
+    cart_items = list(cart.items.select_related('product').order_by('product_id'))
 
     if not cart_items:
         messages.warning(request, 'Ваша корзина пуста')
@@ -1017,7 +1092,7 @@ def checkout(request):
 
     # Расчет стоимости
     subtotal = cart.get_total_price()
-    delivery_method = request.GET.get('delivery', 'pickup')
+    delivery_method = request.POST.get('delivery_method') or request.GET.get('delivery', 'pickup')
 
     # Стоимость доставки в зависимости от метода
     delivery_costs = {
@@ -1029,33 +1104,67 @@ def checkout(request):
     delivery_cost = delivery_costs.get(delivery_method, 0)
     grand_total = subtotal + delivery_cost
 
-    if request.method == 'POST':
-        # Создание заказа
-        order = Order.objects.create(
-            user=request.user,
-            order_number=str(uuid.uuid4())[:8].upper(),
-            total_amount=grand_total,
-            delivery_method=delivery_method,
-            delivery_cost=delivery_cost,
-            notes=request.POST.get('notes', ''),
-            status='pending'
-        )
+    quantities = {item.product_id: item.quantity for item in cart_items}
 
-        # Добавление товаров в заказ
-        for cart_item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                quantity=cart_item.quantity,
-                price=cart_item.product.get_final_price()
-            )
-
-        # Очистка корзины
-        cart.items.all().delete()
+    if request.method == 'POST':
+        address = addresses.filter(pk=request.POST.get('address_id') or None).first()
+        try:
+            # Заказ, позиции, списание со склада и очистка корзины - одна
+            # транзакция с постоянным числом запросов
+            with transaction.atomic():
+                # Товары блокируются в порядке id; цены берутся из заблокированных строк
+                products = reservations.consume(request.user, quantities)
+                subtotal = sum(
+                    (products[item.product_id].get_final_price() * item.quantity for item in cart_items),
+                    Decimal('0')
+                )
+
+                order = Order.objects.create(
+                    user=request.user,
+                    subtotal=subtotal,
+                    total_amount=subtotal + delivery_cost,
+                    delivery_method=delivery_method,
+                    delivery_cost=delivery_cost,
+                    payment_method=request.POST.get('payment_method', 'card'),
+                    recipient_name=address.recipient_name if address else request.POST.get('address_recipient', ''),
+                    recipient_phone=address.phone if address else request.POST.get('address_phone', ''),
+                    delivery_city=address.city if address else request.POST.get('address_city', ''),
+                    delivery_address=address.street if address else request.POST.get('address_street', ''),
+                    delivery_postal_code=address.postal_code if address else request.POST.get('address_postal_code', ''),
+                    notes=request.POST.get('order_notes', ''),
+                    status='pending'
+                )
+
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product=products[item.product_id],
+                        quantity=item.quantity,
+                        price=products[item.product_id].get_final_price()
+                    )
+                    for item in cart_items
+                ])
+
+                # Очистка корзины
+                UserCart(request.user).clear()
+
+                # Статистика покупателя и письмо - фоновым заданием после фиксации заказа
+                jobs.enqueue('order_placed', order_id=order.id)
+        except InsufficientStock:
+            messages.error(request, 'Часть товаров закончилась на складе, проверьте корзину')
+            return redirect('cart')
+        reset_cart_summary(request)
 
         messages.success(request, f'Заказ #{order.order_number} успешно оформлен!')
         return redirect('order_detail', order_id=order.id)
 
+    # Товары резервируются (или резерв продлевается) на время оформления
+    try:
+        reservations.reserve_many(request.user, quantities)
+    except InsufficientStock:
+        messages.error(request, 'Часть товаров закончилась на складе, проверьте корзину')
+        return redirect('cart')
+
     context = {
         'cart': cart,
         'cart_items': cart_items,
@@ -1064,6 +1173,8 @@ def checkout(request):
         'delivery_cost': delivery_cost,
         'grand_total': grand_total,
         'delivery_method': delivery_method,
+        # Повторная отправка формы не создаст второй заказ (idempotency.py)
+        'idempotency_key': uuid.uuid4().hex,
     }
     return render(request, 'sportshop/checkout.html', context)
 
@@ -1254,12 +1365,11 @@ def api_update_order_status(request, order_id):
                 'error': f'Недопустимый статус: {new_status}'
             }, status=400)
 
-        # Обновляем статус
-        order.status = new_status
-        order.save()
-
-        # Логируем изменение
-        print(f"[{timezone.now()}] Статус заказа #{order.order_number} изменен: {old_status} -> {new_status}")
+        # Статус и задание (журнал, уведомление покупателя) фиксируются вместе
+        with transaction.atomic():
+            order.status = new_status
+            order.save()
+            jobs.enqueue('order_status_changed', order_id=order.id, old_status=old_status, new_status=new_status)
 
         return JsonResponse({
             'success': True,